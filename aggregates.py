@@ -0,0 +1,64 @@
+"""Agrégats des tableaux de bord, calculés une fois par version du dataset.
+
+Les pages Streamlit relisaient toutes les lignes à chaque interaction
+(value_counts, histogrammes filtrés, df.corr()). Ici ces agrégats sont
+calculés une seule fois par empreinte de dataset et partagés par toutes les
+pages et toutes les sessions du processus : un rendu ne coûte plus que
+O(nombre de bins).
+
+Les agrégats sont le résumé d'un `streaming_stats.RunningStats` : un état
+mis à jour au fil de l'eau et sauvegardé sur disque se lit de la même façon
+(`load_stats_summary`).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from streaming_stats import RunningStats
+
+# Nombre d'agrégats gardés en mémoire (un par version de dataset / paramètres)
+MAX_CACHED = 8
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def compute_aggregates(df, label_column, amount_column, time_column, time_unit='s', bins=50):
+    """Comptages, histogrammes des montants (bins fixes), activité horaire et corrélations"""
+    stats = RunningStats.for_frame(df, label_column, amount_column, time_column,
+                                   time_unit=time_unit, bins=bins)
+    return stats.update(df).summary()
+
+
+def get_aggregates(fingerprint, df, label_column, amount_column, time_column,
+                   time_unit='s', bins=50):
+    """Agrégats du dataset identifié par `fingerprint`, calculés au premier appel seulement.
+
+    `fingerprint` doit changer dès que les données changent (ex. csv_cache.fingerprint).
+    """
+    key = (fingerprint, label_column, amount_column, time_column, time_unit, bins)
+    # Un seul calcul même si plusieurs sessions arrivent en même temps
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+        result = compute_aggregates(df, label_column, amount_column, time_column, time_unit, bins)
+        _cache[key] = result
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+        return result
+
+
+def load_stats_summary(path):
+    """Résumé d'un état streaming_stats sauvegardé, relu seulement quand le fichier change"""
+    stat = os.stat(path)
+    key = ('stats', os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+        result = RunningStats.load(path).summary()
+        _cache[key] = result
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+        return result
@@ -0,0 +1,148 @@
+"""Flux d'alertes paginé sur les transactions signalées par le modèle.
+
+L'index des transactions signalées (score > seuil) est construit une seule
+fois par version des données et du modèle, trié par score décroissant puis
+par date décroissante. Une page se lit par curseur (position dans l'index)
+avec filtres de montant et d'heure, sans reparcourir le DataFrame : seules
+les alertes qui suivent le curseur sont examinées, par tranches vectorisées.
+
+    feed = AlertFeed.from_scores(probabilities, df['time'], df['amount'], time_unit='h')
+    page, cursor = feed.page(limit=20, amount_range=(100, None), hour_range=(22, 5))
+"""
+import html
+
+import numpy as np
+import pandas as pd
+
+from scoring import RISK_HIGH, RISK_LOW, RISK_MEDIUM, SUSPECT_THRESHOLD, risk_bands
+from streaming_stats import hours_of
+
+# Nombre minimal d'alertes examinées à la fois quand un filtre est actif
+SCAN_CHUNK = 4096
+
+# Libellé et action affichés pour chaque niveau de risque
+BAND_LABELS = {RISK_HIGH: 'Élevé', RISK_MEDIUM: 'Moyen', RISK_LOW: 'Faible'}
+BAND_ACTIONS = {
+    RISK_HIGH: '🚨 Transaction bloquée automatiquement',
+    RISK_MEDIUM: '⚠️ Vérification manuelle requise',
+    RISK_LOW: '✅ Approuvée automatiquement',
+}
+
+
+class AlertFeed:
+    """Index trié (score, date) des transactions signalées, paginé par curseur"""
+
+    def __init__(self, rows, scores, times, amounts, hours, bands, version=''):
+        self.rows = rows
+        self.scores = scores
+        self.times = times
+        self.amounts = amounts
+        self.hours = hours
+        self.bands = bands
+        self.version = version
+
+    @classmethod
+    def from_scores(cls, scores, times, amounts, time_unit='s', min_score=None,
+                    decisions=None, rows=None, version=''):
+        """Construit l'index à partir des scores de toutes les transactions.
+
+        Sont signalées les transactions de score > min_score (SUSPECT_THRESHOLD
+        par défaut, comme le niveau « moyen ») ou dont la décision vaut 1.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        min_score = SUSPECT_THRESHOLD if min_score is None else min_score
+        flagged = scores > min_score
+        if decisions is not None:
+            flagged |= np.asarray(decisions) == 1
+        index = np.flatnonzero(flagged)
+        # Score décroissant, puis transaction la plus récente d'abord
+        order = index[np.lexsort((-times[index], -scores[index]))]
+        decisions_sorted = None if decisions is None else np.asarray(decisions)[order]
+        row_ids = order if rows is None else np.asarray(rows)[order]
+        return cls(row_ids, scores[order], times[order], amounts[order],
+                   hours_of(times[order], time_unit), risk_bands(scores[order], decisions_sorted),
+                   version=version)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _cursor_position(self, cursor):
+        if not cursor:
+            return 0
+        version, _, position = str(cursor).rpartition(':')
+        if version != str(self.version):
+            raise ValueError("Curseur périmé : le flux d'alertes a été reconstruit")
+        return int(position)
+
+    def _matches(self, start, stop, amount_range, hour_range):
+        mask = np.ones(stop - start, dtype=bool)
+        if amount_range is not None:
+            low, high = amount_range
+            amounts = self.amounts[start:stop]
+            if low is not None:
+                mask &= amounts >= low
+            if high is not None:
+                mask &= amounts <= high
+        if hour_range is not None:
+            first, last = hour_range
+            hours = self.hours[start:stop]
+            if first <= last:
+                mask &= (hours >= first) & (hours <= last)
+            else:  # Plage qui passe minuit, ex. (22, 5)
+                mask &= (hours >= first) | (hours <= last)
+        return start + np.flatnonzero(mask)
+
+    def page(self, cursor=None, limit=20, amount_range=None, hour_range=None):
+        """(DataFrame des alertes, curseur suivant ou None à la fin du flux).
+
+        amount_range : (min, max) en USD, bornes incluses, None = pas de borne.
+        hour_range : (première, dernière) heure incluses, peut passer minuit.
+        """
+        position = self._cursor_position(cursor)
+        total = len(self.rows)
+        selected = []
+        found = 0
+        while position < total and found < limit:
+            stop = min(total, position + (limit if amount_range is None and hour_range is None
+                                          else max(SCAN_CHUNK, 4 * limit)))
+            matches = self._matches(position, stop, amount_range, hour_range)[:limit - found]
+            selected.append(matches)
+            found += len(matches)
+            # Reprise juste après la dernière alerte rendue (ou après la tranche entière)
+            position = matches[-1] + 1 if found == limit else stop
+        index = np.concatenate(selected) if selected else np.empty(0, dtype=np.int64)
+        page = pd.DataFrame({
+            'row': self.rows[index],
+            'score': self.scores[index],
+            'time': self.times[index],
+            'hour': self.hours[index],
+            'amount': self.amounts[index],
+            'risk_band': self.bands[index],
+        })
+        next_cursor = f'{self.version}:{position}' if position < total else None
+        return page, next_cursor
+
+
+def render_html(page, css_class='fraud-alert', title='🚨 ALERTE FRAUDE', time_format='{:.1f}h'):
+    """Bloc HTML unique pour toute la page d'alertes (un seul élément Streamlit).
+
+    Une colonne optionnelle `reasons` (texte, ex. principaux facteurs du score) est affichée.
+    """
+    amounts = page['amount'].map('{:,.2f}'.format)
+    times = page['time'].map(time_format.format)
+    scores = page['score'].map('{:.1%}'.format)
+    bands = page['risk_band'].map(BAND_LABELS).fillna('').map(html.escape)
+    actions = page['risk_band'].map(BAND_ACTIONS).fillna('')
+    if 'reasons' in page:
+        reasons = page['reasons'].map(lambda r: f'<p><strong>Facteurs:</strong> {html.escape(r)}</p>')
+    else:
+        reasons = [''] * len(page)
+    return ''.join(
+        f'<div class="{css_class}"><h4>{title} - Montant: ${amount}</h4>'
+        f'<p><strong>Heure:</strong> {time} | <strong>Score:</strong> {score} | '
+        f'<strong>Risque:</strong> {band}</p>'
+        f'{reason}<p><strong>Action:</strong> {action}</p></div>'
+        for amount, time, score, band, reason, action in zip(amounts, times, scores, bands, reasons, actions)
+    )
@@ -3,13 +3,20 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, confusion_matrix
 import joblib
 import warnings
 warnings.filterwarnings('ignore')
 
+from model_store import load_or_build
+from scoring import DECISION_THRESHOLD, RISK_HIGH, RISK_MEDIUM, score_batch, score_transaction
+from synthetic_data import GENERATOR_VERSION, TRAINING_PARAMS, fit_fraud_model, generate_fraud_frame
+from aggregates import get_aggregates
+import chart_cache
+from alert_feed import AlertFeed, render_html
+from explain import ForestExplainer, format_contributions
+from evaluation import get_evaluation
+from sensitivity import describe, plot_curve, plot_heatmap, standard_sweeps, sweep
+
 # Configuration de la page
 st.set_page_config(
     page_title="Détection de Fraude Bancaire IA",
@@ -54,76 +61,32 @@ st.markdown("""
 
 # Générer des données de fraude bancaire réalistes
 @st.cache_data
-def generate_fraud_data(n_samples=10000):
+def generate_fraud_data(n_samples=10000, seed=42):
     """Génère des données de transactions bancaires réalistes avec fraude"""
-    np.random.seed(42)
-    
-    # Caractéristiques des transactions
-    data = {
-        'amount': np.exp(np.random.normal(4, 1.5, n_samples)),  # Montants (distribution log-normale)
-        'time': np.random.uniform(0, 24, n_samples),  # Heure de la journée
-        'v1': np.random.normal(0, 1, n_samples),
-        'v2': np.random.normal(0, 1, n_samples),
-        'v3': np.random.normal(0, 1, n_samples),
-        'v4': np.random.normal(0, 1, n_samples),
-        'v5': np.random.normal(0, 1, n_samples),
-        'v6': np.random.normal(0, 1, n_samples),
-        'v7': np.random.normal(0, 1, n_samples),
-        'v8': np.random.normal(0, 1, n_samples),
-        'v9': np.random.normal(0, 1, n_samples),
-        'v10': np.random.normal(0, 1, n_samples),
-    }
-    
-    df = pd.DataFrame(data)
-    
-    # Créer des motifs de fraude réalistes
-    fraud_probability = (
-        (df['amount'] > 1000) * 0.3 +
-        (df['time'] < 6) * 0.2 +  # Nuit = risque plus élevé
-        (df['time'] > 22) * 0.2 +
-        (np.abs(df['v1']) > 2) * 0.1 +
-        (np.abs(df['v2']) > 2) * 0.1 +
-        (np.abs(df['v3']) > 2) * 0.1
-    )
-    
-    # Générer les labels de fraude
-    df['is_fraud'] = np.random.binomial(1, fraud_probability.clip(0, 0.5))
-    
-    # Ajuster pour avoir ~1% de fraudes (réaliste)
-    fraud_rate = df['is_fraud'].mean()
-    if fraud_rate < 0.01:
-        n_additional_frauds = int(0.01 * n_samples) - df['is_fraud'].sum()
-        additional_indices = np.random.choice(
-            df[df['is_fraud'] == 0].index, 
-            n_additional_frauds, 
-            replace=False
-        )
-        df.loc[additional_indices, 'is_fraud'] = 1
-    
-    return df
+    # Générateur vectorisé (float32, reproductible par graine) partagé avec les tests de charge
+    return generate_fraud_frame(n_samples, seed=seed)
+
+@st.cache_resource
+def load_fraud_artifact():
+    """Charge le modèle versionné sur disque (ré-entraîné seulement si TRAINING_PARAMS change)"""
+    return load_or_build('fraud_model', TRAINING_PARAMS, fit_fraud_model)
+
+@st.cache_resource
+def load_alert_feed(data_key, model_key, _df, _forest, feature_columns):
+    """Index des alertes, construit une fois par version des données et du modèle"""
+    probabilities, decisions, _ = score_batch(_forest, _df[feature_columns])
+    return AlertFeed.from_scores(probabilities, _df['time'], _df['amount'], time_unit='h',
+                                 decisions=decisions, version=f'{data_key}-{model_key}')
 
 @st.cache_resource
+def load_explainer(model_key, _forest):
+    """Explications des scores (contributions par feature), une instance par version du modèle"""
+    return ForestExplainer(_forest)
+
 def train_fraud_model():
-    """Entraîne un modèle de détection de fraude"""
-    df = generate_fraud_data(5000)
-    
-    # Features et target
-    feature_columns = ['amount', 'time', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6', 'v7', 'v8', 'v9', 'v10']
-    X = df[feature_columns]
-    y = df['is_fraud']
-    
-    # Entraînement du modèle
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
-    
-    model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
-        random_state=42,
-        class_weight='balanced'
-    )
-    model.fit(X_train, y_train)
-    
-    return model, X_test, y_test, feature_columns
+    """Modèle, jeu de test et features de l'artefact courant"""
+    artifact = load_fraud_artifact()
+    return artifact['model'], artifact['X_test'], artifact['y_test'], artifact['feature_columns']
 
 def main():
     # Header principal
@@ -140,18 +103,35 @@ def main():
     
     # Charger les données et modèle
     model, X_test, y_test, feature_columns = train_fraud_model()
-    df = generate_fraud_data(2000)  # Plus petit dataset pour l'affichage
+    artifact = load_fraud_artifact()
+    forest = artifact['forest']
+    explainer = load_explainer(artifact['key'], forest)
+    # Jeu de test scoré une fois par version du modèle ; tout seuil se lit ensuite en O(log n)
+    evaluation = get_evaluation(artifact['key'], forest, X_test, y_test)
+    n_display, display_seed = 2000, 42  # Plus petit dataset pour l'affichage
+    df = generate_fraud_data(n_display, seed=display_seed)
+    
+    # Agrégats calculés une fois par version des données, partagés entre sessions
+    data_key = f"synthetic-v{GENERATOR_VERSION}-{n_display}-{display_seed}"
+    agg = get_aggregates(data_key, df, 'is_fraud', 'amount', 'time', time_unit='h', bins=30)
     
     if page == "📊 Tableau de Bord":
-        show_dashboard(df, model, X_test, y_test)
+        feed = load_alert_feed(data_key, artifact['key'], df, forest, feature_columns)
+        show_dashboard(df, agg, feed, explainer, feature_columns, evaluation)
     elif page == "🧪 Testeur de Transactions":
-        show_transaction_tester(model, feature_columns)
+        show_transaction_tester(forest, explainer, feature_columns, artifact['key'])
     elif page == "📈 Analytics":
-        show_analytics(df)
+        show_analytics(agg, data_key)
     else:
-        show_model_info(model, X_test, y_test, feature_columns)
+        show_model_info(model, evaluation, feature_columns, artifact['key'])
+    
+    # Efficacité du cache des graphiques
+    charts = chart_cache.stats()
+    st.sidebar.caption(f"🖼️ Cache graphiques : {charts['hit_rate']:.0%} de hits "
+                       f"({charts['hits']}/{charts['hits'] + charts['misses']}, "
+                       f"{charts['entries']} images, {charts['bytes'] / 1024:.0f} Ko)")
 
-def show_dashboard(df, model, X_test, y_test):
+def show_dashboard(df, agg, feed, explainer, feature_columns, evaluation):
     st.header("📊 TABLEAU DE BORD EN TEMPS RÉEL")
     
     # Métriques principales
@@ -159,55 +139,69 @@ def show_dashboard(df, model, X_test, y_test):
     
     with col1:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.metric("💰 Transactions Total", f"{len(df):,}")
+        st.metric("💰 Transactions Total", f"{agg['n_rows']:,}")
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col2:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        fraud_count = df['is_fraud'].sum()
+        fraud_count = agg['fraud_count']
         st.metric("🚨 Fraudes Détectées", fraud_count)
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col3:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        fraud_rate = (fraud_count / len(df)) * 100
+        fraud_rate = agg['fraud_rate'] * 100
         st.metric("📈 Taux de Fraude", f"{fraud_rate:.3f}%")
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col4:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        accuracy = model.score(X_test, y_test)
+        accuracy = evaluation.at(DECISION_THRESHOLD)['accuracy']
         st.metric("🎯 Précision IA", f"{accuracy:.1%}")
         st.markdown('</div>', unsafe_allow_html=True)
     
-    # Alertes récentes simulées
-    st.subheader("🚨 ALERTES RÉCENTES")
-    
-    # Générer des alertes réalistes
-    fraud_transactions = df[df['is_fraud'] == 1].head(3)
-    
-    for _, tx in fraud_transactions.iterrows():
-        st.markdown(f"""
-        <div class="fraud-alert">
-            <h4>🚨 ALERTE FRAUDE - Montant: ${tx['amount']:,.2f}</h4>
-            <p><strong>Heure:</strong> {tx['time']:.1f}h | <strong>Risque:</strong> Élevé</p>
-            <p><strong>Action:</strong> 🚨 Transaction bloquée automatiquement</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    # Transactions normales récentes
-    normal_transactions = df[df['is_fraud'] == 0].head(2)
-    
-    for _, tx in normal_transactions.iterrows():
-        st.markdown(f"""
-        <div class="success-box">
-            <h4>✅ TRANSACTION NORMALE - Montant: ${tx['amount']:,.2f}</h4>
-            <p><strong>Heure:</strong> {tx['time']:.1f}h | <strong>Risque:</strong> Faible</p>
-            <p><strong>Statut:</strong> ✅ Approuvée automatiquement</p>
-        </div>
-        """, unsafe_allow_html=True)
+    # File d'alertes : transactions signalées par le modèle, par score puis date
+    st.subheader(f"🚨 ALERTES ({len(feed):,} transactions signalées)")
+    
+    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    with filter_col1:
+        min_amount = st.number_input("Montant minimum ($)", min_value=0.0, value=0.0, step=100.0)
+    with filter_col2:
+        first_hour, last_hour = st.slider("Heures", 0, 23, (0, 23))
+    with filter_col3:
+        page_size = st.selectbox("Alertes par page", [5, 10, 20, 50], index=0)
+    
+    # Pagination par curseur ; retour au début dès que les filtres changent
+    filters = (min_amount, first_hour, last_hour, page_size, feed.version)
+    if st.session_state.get('alert_filters') != filters:
+        st.session_state['alert_filters'] = filters
+        st.session_state['alert_cursors'] = [None]
+    cursors = st.session_state['alert_cursors']
+    page, next_cursor = feed.page(cursors[-1], limit=page_size,
+                                  amount_range=(min_amount or None, None),
+                                  hour_range=(first_hour, last_hour))
+    
+    if len(page):
+        # Principaux facteurs de chaque alerte, expliquées en un seul lot
+        top = explainer.top_features(df[feature_columns].iloc[page['row']].to_numpy(), k=3)
+        page['reasons'] = [format_contributions(features) for features in top]
+        st.markdown(render_html(page), unsafe_allow_html=True)
+    else:
+        st.info("Aucune alerte pour ces filtres")
+    
+    nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+    with nav_col1:
+        if st.button("⬅️ Précédentes", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with nav_col2:
+        st.caption(f"Page {len(cursors)}")
+    with nav_col3:
+        if st.button("Suivantes ➡️", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
 
-def show_transaction_tester(model, feature_columns):
+def show_transaction_tester(model, explainer, feature_columns, model_key):
     st.header("🧪 TESTEUR DE TRANSACTIONS INTELLIGENT")
     
     col1, col2 = st.columns([1, 1])
@@ -239,15 +233,15 @@ def show_transaction_tester(model, feature_columns):
             input_df = pd.DataFrame([transaction_data])
             input_df = input_df[feature_columns]  # S'assurer du bon ordre
             
-            # Prédiction
-            prediction = model.predict(input_df)[0]
-            probabilities = model.predict_proba(input_df)[0]
-            fraud_probability = probabilities[1]
+            # Prédiction (un seul passage dans la forêt)
+            score = score_transaction(model, input_df)
+            fraud_probability = score['probability']
+            risk_band = score['risk_band']
             
             with col2:
                 st.subheader("📊 RÉSULTATS DE L'ANALYSE IA")
                 
-                if prediction == 1 or fraud_probability > 0.7:
+                if risk_band == RISK_HIGH:
                     st.markdown(f"""
                     <div class="fraud-alert">
                         <h2>🚨 FRAUDE DÉTECTÉE !</h2>
@@ -261,7 +255,7 @@ def show_transaction_tester(model, feature_columns):
                         </ul>
                     </div>
                     """, unsafe_allow_html=True)
-                elif fraud_probability > 0.3:
+                elif risk_band == RISK_MEDIUM:
                     st.warning(f"⚠️ **TRANSACTION SUSPECTE**")
                     st.write(f"**Probabilité de fraude:** {fraud_probability:.1%}")
                     st.write("**Action:** Vérification manuelle requise")
@@ -276,53 +270,140 @@ def show_transaction_tester(model, feature_columns):
                     </div>
                     """, unsafe_allow_html=True)
                 
-                # Jauge de risque
-                fig, ax = plt.subplots(figsize=(10, 2))
-                ax.barh(['Risque de Fraude'], [fraud_probability * 100], 
-                       color='red' if fraud_probability > 0.7 else 'orange' if fraud_probability > 0.3 else 'green')
-                ax.set_xlim(0, 100)
-                ax.set_xlabel('Pourcentage de Risque')
-                ax.set_title('Niveau de Risque de la Transaction')
-                ax.text(fraud_probability * 100 + 2, 0, f'{fraud_probability:.1%}', va='center', fontsize=12)
-                st.pyplot(fig)
+                # Jauge de risque (au 1/1000 près : même image pour des probabilités voisines)
+                gauge_probability = round(float(fraud_probability), 3)
+                
+                def draw_gauge():
+                    fig, ax = plt.subplots(figsize=(10, 2))
+                    ax.barh(['Risque de Fraude'], [gauge_probability * 100], 
+                           color='red' if risk_band == RISK_HIGH else 'orange' if risk_band == RISK_MEDIUM else 'green')
+                    ax.set_xlim(0, 100)
+                    ax.set_xlabel('Pourcentage de Risque')
+                    ax.set_title('Niveau de Risque de la Transaction')
+                    ax.text(gauge_probability * 100 + 2, 0, f'{gauge_probability:.1%}', va='center', fontsize=12)
+                    return fig
+                
+                st.image(chart_cache.render('risk_gauge', None, (gauge_probability, risk_band), draw_gauge),
+                         width='stretch')
+                
+                # Contributions de chaque feature au score de cette transaction
+                st.subheader("🔎 Pourquoi ce score ?")
+                explanation = explainer.explain_row(input_df)
+                st.caption(f"Score moyen de la forêt : {explainer.bias:.1%} ; "
+                           f"les contributions ci-dessous s'y ajoutent pour donner {fraud_probability:.1%}")
+                st.dataframe(explanation.head(8).map('{:+.2%}'.format).rename('Contribution'),
+                             width='stretch')
+    
+    # Analyse de sensibilité : toutes les variantes de la transaction scorées en un seul appel
+    st.subheader("📉 Analyse de Sensibilité")
+    base = pd.Series({'amount': montant, 'time': heure, 'v1': v1, 'v2': v2, 'v3': v3,
+                      'v4': 0.0, 'v5': 0.0, 'v6': 0.0, 'v7': 0.0, 'v8': 0.0, 'v9': 0.0, 'v10': 0.0})
+    sweeps = standard_sweeps(base, 'amount', 'time', ['v1', 'v2', 'v3'], (1, 5000))
+    choice = st.selectbox("Faire varier", list(sweeps))
+    result = sweep(model, base, sweeps[choice], columns=feature_columns)
+    draw = plot_curve if len(result['axes']) == 1 else plot_heatmap
+    params = (choice, tuple(round(float(v), 6) for v in base), [axis.key() for axis in result['axes']])
+    st.image(chart_cache.render('sensitivity', model_key, params, lambda: draw(result)), width='stretch')
+    st.caption(describe(result))
 
-def show_analytics(df):
+def show_analytics(agg, data_key):
     st.header("📈 ANALYTICS AVANCÉES")
     
-    col1, col2 = st.columns(2)
+    # Graphiques rendus une fois par version des données (chart_cache)
+    bins = len(agg['amount_edges']) - 1
     
-    with col1:
-        st.subheader("📊 Distribution des Montants")
+    def draw_amounts():
         fig, ax = plt.subplots(figsize=(10, 6))
-        ax.hist(df['amount'], bins=30, alpha=0.7, color='skyblue', edgecolor='black')
+        edges = agg['amount_edges']
+        ax.hist(edges[:-1], bins=edges, weights=agg['amount_hist']['all'],
+                alpha=0.7, color='skyblue', edgecolor='black')
         ax.set_xlabel('Montant (USD)')
         ax.set_ylabel('Nombre de Transactions')
         ax.set_title('Distribution des Montants de Transaction')
         ax.grid(True, alpha=0.3)
-        st.pyplot(fig)
+        return fig
     
-    with col2:
-        st.subheader("🕒 Activité par Heure")
+    def draw_hours():
         fig, ax = plt.subplots(figsize=(10, 6))
-        hours = df['time'].apply(lambda x: int(x))
-        hour_counts = hours.value_counts().sort_index()
-        ax.bar(hour_counts.index, hour_counts.values, color='lightcoral', alpha=0.7)
+        hour_counts = agg['hourly_counts']
+        ax.bar(np.arange(24), hour_counts, color='lightcoral', alpha=0.7)
         ax.set_xlabel('Heure de la Journée')
         ax.set_ylabel('Nombre de Transactions')
         ax.set_title('Activité Transactionnelle par Heure')
         ax.set_xticks(range(0, 24, 3))
         ax.grid(True, alpha=0.3)
-        st.pyplot(fig)
+        return fig
+    
+    def draw_heatmap():
+        fig, ax = plt.subplots(figsize=(12, 8))
+        sns.heatmap(agg['corr'], annot=True, cmap='coolwarm', center=0, ax=ax)
+        ax.set_title('Matrice de Corrélation des Features')
+        return fig
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("📊 Distribution des Montants")
+        st.image(chart_cache.render('amount_hist', data_key, {'bins': bins}, draw_amounts),
+                 width='stretch')
+    
+    with col2:
+        st.subheader("🕒 Activité par Heure")
+        st.image(chart_cache.render('hourly_activity', data_key, {}, draw_hours),
+                 width='stretch')
     
     # Heatmap de corrélation
     st.subheader("🎯 Heatmap des Corrélations")
-    corr_matrix = df.corr()
-    fig, ax = plt.subplots(figsize=(12, 8))
-    sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', center=0, ax=ax)
-    ax.set_title('Matrice de Corrélation des Features')
-    st.pyplot(fig)
+    st.image(chart_cache.render('corr_heatmap', data_key, {'annot': True}, draw_heatmap),
+             width='stretch')
+
+def show_threshold_tuning(evaluation, model_key):
+    st.subheader("🎚️ Choix du Seuil de Décision")
+    
+    best = evaluation.best_threshold('f1')
+    threshold = st.slider("Seuil (probabilité au-delà de laquelle la transaction est signalée)",
+                          0.0, 1.0, float(DECISION_THRESHOLD), 0.01)
+    metrics = evaluation.at(threshold)
+    
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("🎯 Précision (alertes justes)", f"{metrics['precision']:.1%}")
+    m2.metric("🔍 Rappel (fraudes trouvées)", f"{metrics['recall']:.1%}")
+    m3.metric("⚠️ Faux positifs", f"{metrics['fpr']:.2%}")
+    m4.metric("🚨 Alertes", f"{metrics['flagged']}")
+    st.caption(f"Seuil en production : {DECISION_THRESHOLD:.2f} ; meilleur F1 ({best['f1']:.3f}) "
+               f"au seuil {best['threshold']:.3f}. AUC ROC {evaluation.roc_auc():.3f}, "
+               f"précision moyenne {evaluation.average_precision():.3f}.")
+    
+    matrix_col, curves_col = st.columns([1, 2])
+    with matrix_col:
+        st.write("**Matrice de confusion**")
+        st.dataframe(pd.DataFrame(evaluation.confusion(threshold),
+                                  index=['Réel : normale', 'Réel : fraude'],
+                                  columns=['Prédit : normale', 'Prédit : fraude']),
+                     width='stretch')
+    
+    # Courbes rendues une fois par version du modèle
+    def draw_curves():
+        fpr, tpr, _ = evaluation.roc()
+        precision, recall, _ = evaluation.pr()
+        fig, (ax_roc, ax_pr) = plt.subplots(1, 2, figsize=(10, 4))
+        ax_roc.plot(fpr, tpr, color='#1f77b4')
+        ax_roc.plot([0, 1], [0, 1], color='grey', linestyle='--', linewidth=1)
+        ax_roc.set_xlabel('Taux de faux positifs')
+        ax_roc.set_ylabel('Taux de vrais positifs')
+        ax_roc.set_title(f'Courbe ROC (AUC {evaluation.roc_auc():.3f})')
+        ax_pr.plot(recall, precision, color='#d62728')
+        ax_pr.set_xlabel('Rappel')
+        ax_pr.set_ylabel('Précision')
+        ax_pr.set_ylim(0, 1.05)
+        ax_pr.set_title(f'Précision-rappel (AP {evaluation.average_precision():.3f})')
+        fig.tight_layout()
+        return fig
+    
+    with curves_col:
+        st.image(chart_cache.render('evaluation_curves', model_key, {}, draw_curves), width='stretch')
 
-def show_model_info(model, X_test, y_test, feature_columns):
+def show_model_info(model, evaluation, feature_columns, model_key):
     st.header("🤖 INFORMATIONS DU MODÈLE IA")
     
     # Performance du modèle
@@ -330,19 +411,22 @@ def show_model_info(model, X_test, y_test, feature_columns):
     
     col1, col2, col3 = st.columns(3)
     
+    current = evaluation.at(DECISION_THRESHOLD)
+    
     with col1:
-        accuracy = model.score(X_test, y_test)
+        accuracy = current['accuracy']
         st.metric("🎯 Précision", f"{accuracy:.1%}")
     
     with col2:
-        y_pred = model.predict(X_test)
-        fraud_detected = y_pred.sum()
+        fraud_detected = current['flagged']
         st.metric("🚨 Fraudes Détectées", f"{fraud_detected}")
     
     with col3:
-        total_transactions = len(X_test)
+        total_transactions = len(evaluation)
         st.metric("📈 Transactions Testées", f"{total_transactions}")
     
+    show_threshold_tuning(evaluation, model_key)
+    
     # Importance des features
     st.subheader("🔍 Importance des Features")
     
@@ -352,10 +436,14 @@ def show_model_info(model, X_test, y_test, feature_columns):
             'Importance': model.feature_importances_
         }).sort_values('Importance', ascending=False)
         
-        fig, ax = plt.subplots(figsize=(10, 6))
-        sns.barplot(data=feature_importance.head(10), x='Importance', y='Feature', ax=ax)
-        ax.set_title('Top 10 des Features les Plus Importantes')
-        st.pyplot(fig)
+        def draw_importances():
+            fig, ax = plt.subplots(figsize=(10, 6))
+            sns.barplot(data=feature_importance.head(10), x='Importance', y='Feature', ax=ax)
+            ax.set_title('Top 10 des Features les Plus Importantes')
+            return fig
+        
+        st.image(chart_cache.render('feature_importance', model_key, {'top': 10}, draw_importances),
+                 width='stretch')
         
         st.dataframe(feature_importance, use_container_width=True)
     
@@ -1,12 +1,139 @@
-from flask import Flask, request
-import joblib
+from flask import Flask, request, jsonify
+from werkzeug.exceptions import HTTPException
+import atexit
+import os
+
 import pandas as pd
 import numpy as np
 
+from dataset_store import get_store
+from metrics import REQUEST_METRICS, instrument
+from micro_batcher import MicroBatcher, from_env
+from forest_engine import compile_from_env
+from model_registry import ModelRegistry
+from model_store import CREDITCARD_MODEL
+from scoring import score_batch, score_transaction, thresholds
+from velocity import VelocityStore
+
 app = Flask(__name__)
+# Durées par route et par étape sur GET /metrics, profilage si FRAUDE_PROFILE_RATE > 0
+instrument(app)
+stage = REQUEST_METRICS.stage
+
+# Charger ton modèle : le dernier publié (training.py, incremental.py), sinon
+# FRAUDE_MODEL_PATH (modèle picklé, ou forêt compacte exportée par forest_engine.py
+# --compact, chargée par memory-mapping) ; forêt compilée si FRAUDE_COMPILED_FOREST=1.
+# Le registre surveille models/ et remplace le modèle actif à chaud (POST /v1/reload
+# pour forcer la vérification), avec shadow scoring optionnel (FRAUDE_SHADOW_MODEL).
+MODEL_PATH = os.environ.get('FRAUDE_MODEL_PATH', 'mon_premier_modele_anti_fraude.pkl')
+registry = ModelRegistry.from_env(fallbacks={CREDITCARD_MODEL: MODEL_PATH},
+                                  prepare=compile_from_env)
+
+# Prédictions unitaires regroupées en micro-lots si FRAUDE_MICRO_BATCH=1
+scorer = from_env(registry.model)
+
+# Dataset chargé une seule fois par processus, dans l'ordre des features du modèle
+store = get_store('creditcard.csv', columns=getattr(registry.model, 'feature_names_in_', None))
+
+# Features de vélocité par carte (/v1/score avec card_id), reprises depuis
+# l'instantané FRAUDE_VELOCITY_SNAPSHOT et réenregistrées à l'arrêt
+velocity = VelocityStore.from_env()
+if os.environ.get('FRAUDE_VELOCITY_SNAPSHOT'):
+    atexit.register(velocity.save, os.environ['FRAUDE_VELOCITY_SNAPSHOT'])
+
+# Nombre maximum de transactions acceptées par appel à /v1/score
+MAX_BATCH_SIZE = 10000
+# Champs optionnels de /v1/score qui ne sont pas des features du modèle
+CONTEXT_FIELDS = ('card_id', 'timestamp')
 
-# Charger ton modèle
-model = joblib.load('mon_premier_modele_anti_fraude.pkl')
+
+class BatchError(ValueError):
+    """Requête /v1/score invalide (renvoyée au client avec un code HTTP)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def feature_columns():
+    """Ordre des features attendu par le modèle"""
+    names = getattr(registry.model, 'feature_names_in_', None)
+    return list(names) if names is not None else store.load().columns
+
+
+def parse_batch(payload):
+    """Convertit un corps JSON /v1/score en (DataFrame (n, n_features) dans l'ordre du modèle,
+    DataFrame des champs optionnels card_id/timestamp ou None).
+
+    Formats acceptés :
+    - lignes : {"transactions": [{"Time": ..., "V1": ..., "Amount": ...}, ...]}
+      (ou directement la liste)
+    - colonnes : {"columns": {"Time": [...], "V1": [...], ..., "Amount": [...]}}
+    """
+    columns = feature_columns()
+
+    if isinstance(payload, dict) and 'columns' in payload:
+        data = payload['columns']
+        if not isinstance(data, dict):
+            raise BatchError("'columns' doit être un objet {feature: [valeurs]}")
+        lengths = {len(v) if isinstance(v, list) else -1 for v in data.values()}
+        if -1 in lengths or len(lengths) > 1:
+            raise BatchError("Chaque colonne doit être une liste de même longueur")
+        n_rows = lengths.pop() if lengths else 0
+    else:
+        data = payload.get('transactions') if isinstance(payload, dict) else payload
+        if not isinstance(data, list) or not all(isinstance(t, dict) for t in data):
+            raise BatchError("'transactions' doit être une liste d'objets {feature: valeur}")
+        n_rows = len(data)
+
+    if n_rows == 0:
+        raise BatchError("Aucune transaction à scorer")
+    if n_rows > MAX_BATCH_SIZE:
+        raise BatchError(f"Lot trop grand : {n_rows} > {MAX_BATCH_SIZE} transactions", status=413)
+
+    batch = pd.DataFrame(data) if isinstance(data, dict) else pd.DataFrame.from_records(data)
+    context = parse_context(batch[[c for c in CONTEXT_FIELDS if c in batch.columns]])
+    batch = batch.drop(columns=[c for c in CONTEXT_FIELDS if c in batch.columns])
+    missing = [c for c in columns if c not in batch.columns]
+    unknown = [c for c in batch.columns if c not in columns]
+    if missing or unknown:
+        raise BatchError(f"Features invalides - manquantes : {missing}, inconnues : {unknown}")
+
+    try:
+        values = batch[columns].to_numpy(dtype=np.float64)
+    except (TypeError, ValueError):
+        raise BatchError("Toutes les features doivent être numériques")
+    if not np.isfinite(values).all():
+        raise BatchError("Valeurs manquantes ou infinies dans le lot")
+    return pd.DataFrame(values, columns=columns, copy=False), context
+
+def parse_context(context):
+    """card_id (obligatoire sur toutes les lignes s'il est donné) et timestamp en secondes"""
+    if 'card_id' not in context.columns:
+        if 'timestamp' in context.columns:
+            raise BatchError("'timestamp' n'est utilisé qu'avec 'card_id'")
+        return None
+    if context['card_id'].isna().any():
+        raise BatchError("'card_id' doit être renseigné pour toutes les transactions")
+    # Vérifié avant toute mise à jour : un identifiant refusé ne laisse pas le lot à moitié appliqué
+    if not all(isinstance(v, (str, int)) and not isinstance(v, bool) for v in context['card_id'].tolist()):
+        raise BatchError("'card_id' doit être une chaîne ou un entier")
+    if 'timestamp' in context.columns:
+        try:
+            timestamps = context['timestamp'].to_numpy(dtype=np.float64)
+        except (TypeError, ValueError):
+            raise BatchError("'timestamp' doit être numérique (secondes)")
+        if not np.isfinite(timestamps).all():
+            raise BatchError("'timestamp' manquant ou infini")
+    return context
+
+def velocity_features(batch, context):
+    """Met à jour le magasin de vélocité ; horodatage : 'timestamp', sinon la feature Time"""
+    timestamps = context['timestamp'] if 'timestamp' in context.columns else batch['Time']
+    features = velocity.update_many(context['card_id'].tolist(), timestamps.tolist(),
+                                    batch['Amount'].tolist())
+    # NaN (première transaction d'une carte) -> null en JSON
+    return {name: [None if v != v else v for v in features[name].tolist()] for name in features.columns}
 
 @app.route('/')
 def home():
@@ -45,27 +172,38 @@ def home():
     </html>
     """
 
+def error_page(message):
+    return f"<div class='container'><p>Erreur : {message}</p><a href='/'>← Retour</a></div>"
+
+@app.errorhandler(Exception)
+def handle_error(e):
+    """Exception non prévue : journalisée avec sa trace, comptée, puis réponse 500"""
+    if isinstance(e, HTTPException):
+        return e
+    app.logger.exception("Erreur sur %s %s", request.method, request.path)
+    REQUEST_METRICS.count_error(e)
+    if request.path.startswith('/v1/'):
+        return jsonify({'error': 'Erreur interne'}), 500
+    return error_page("erreur interne, voir les logs du serveur"), 500
+
 @app.route('/predict', methods=['POST'])
 def predict():
-    try:
-        amount = float(request.form['amount'])
-        
-        # Charger les données originales pour avoir la bonne structure
-        df_original = pd.read_csv('creditcard.csv')
-        
-        # Prendre la première ligne comme template et modifier le montant
-        template = df_original.drop('Class', axis=1).iloc[0:1].copy()
-        
-        # Mettre à jour le montant
-        template['Amount'] = amount
-        
-        # S'assurer que l'ordre des colonnes est exactement le même
-        template = template[df_original.drop('Class', axis=1).columns]
-        
-        # Prédiction
-        prediction = model.predict(template)[0]
-        probability = model.predict_proba(template)[0]
-        
+    with stage('parse'):
+        try:
+            amount = float(request.form['amount'])
+        except (KeyError, ValueError):
+            return error_page("montant invalide"), 400
+    
+    with stage('features'):
+        # Ligne modèle précalculée (première transaction) avec le montant modifié
+        template = store.frame(store.template_with(Amount=amount))
+    
+    with stage('inference'):
+        # Prédiction (un seul passage dans la forêt)
+        score = score_transaction(scorer, template)
+    
+    with stage('render'):
+        prediction = score['decision']
         result = "🚨 FRAUDE" if prediction == 1 else "✅ TRANSACTION NORMALE"
         color_class = "fraude" if prediction == 1 else "normal"
         
@@ -74,35 +212,25 @@ def predict():
             <h1>Résultat de l'analyse</h1>
             <p>Montant analysé : <strong>${amount:.2f}</strong></p>
             <p class="{color_class}">{result}</p>
-            <p>Probabilité de fraude : <strong>{probability[1]:.2%}</strong></p>
-            <p>Probabilité de transaction normale : <strong>{probability[0]:.2%}</strong></p>
+            <p>Probabilité de fraude : <strong>{score['probability']:.2%}</strong></p>
+            <p>Probabilité de transaction normale : <strong>{1 - score['probability']:.2%}</strong></p>
             <a href="/">← Retour à l'accueil</a>
         </div>
         """
-    
-    except Exception as e:
-        return f"<div class='container'><p>Erreur : {str(e)}</p><a href='/'>← Retour</a></div>"
 
 @app.route('/test_reel', methods=['POST'])
 def test_reel():
-    try:
-        # Charger les données
-        df = pd.read_csv('creditcard.csv')
-        
-        # Prendre une transaction au hasard
-        transaction_reelle = df.sample(1)
-        
-        # Séparer les features et la target
-        features = transaction_reelle.drop('Class', axis=1)
-        vraie_valeur = transaction_reelle['Class'].values[0]
-        
-        # S'assurer de l'ordre des colonnes
-        features = features[df.drop('Class', axis=1).columns]
-        
-        # Prédiction
-        prediction = model.predict(features)[0]
-        probability = model.predict_proba(features)[0]
-        
+    with stage('features'):
+        # Prendre une transaction au hasard dans le dataset en mémoire
+        row, vraie_valeur = store.sample()
+        features = store.frame(row)
+    
+    with stage('inference'):
+        # Prédiction (un seul passage dans la forêt)
+        score = score_transaction(scorer, features)
+    
+    with stage('render'):
+        prediction = score['decision']
         result = "🚨 FRAUDE" if prediction == 1 else "✅ TRANSACTION NORMALE"
         vraie_classe = "FRAUDE" if vraie_valeur == 1 else "TRANSACTION NORMALE"
         color_class = "fraude" if prediction == 1 else "normal"
@@ -114,17 +242,86 @@ def test_reel():
             <p>Véritable statut : <strong>{vraie_classe}</strong></p>
             <p class="{color_class}">Prédiction du modèle : {result}</p>
             <p>{correct}</p>
-            <p>Probabilité de fraude : <strong>{probability[1]:.2%}</strong></p>
+            <p>Probabilité de fraude : <strong>{score['probability']:.2%}</strong></p>
             <p>Montant : <strong>${features['Amount'].values[0]:.2f}</strong></p>
             <a href="/">← Retour à l'accueil</a>
         </div>
         """
-    
-    except Exception as e:
-        return f"<div class='container'><p>Erreur : {str(e)}</p><a href='/'>← Retour</a></div>"
+
+@app.route('/v1/score', methods=['POST'])
+def v1_score():
+    """Score un lot de transactions en un seul appel predict_proba (JSON, max MAX_BATCH_SIZE)"""
+    with stage('parse'):
+        payload = request.get_json(silent=True)
+    if payload is None:
+        return jsonify({'error': 'Corps JSON attendu'}), 400
+    try:
+        with stage('features'):
+            batch, context = parse_batch(payload)
+            velocity_data = velocity_features(batch, context) if context is not None else None
+    except BatchError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    with stage('inference'):
+        probabilities, decisions, bands = score_batch(registry.model, batch)
+    with stage('render'):
+        response = {
+            'count': len(batch),
+            'thresholds': thresholds(),
+            'probabilities': probabilities.tolist(),
+            'decisions': decisions.tolist(),
+            'risk_bands': bands.tolist(),
+        }
+        if velocity_data is not None:
+            response['velocity'] = velocity_data
+        return jsonify(response)
+
+@app.route('/v1/stats')
+def stats():
+    """Statistiques du micro-batcher (file, tailles de lot, attente ajoutée) et modèle actif"""
+    batcher = scorer.stats() if isinstance(scorer, MicroBatcher) else None
+    active = registry.entry()
+    return jsonify({'micro_batcher': batcher, 'model': active.handle.version(),
+                    'model_swaps': active.handle.swaps,
+                    'velocity': {'cards': len(velocity), 'events': velocity.events}})
+
+@app.route('/v1/reload', methods=['POST'])
+def reload_model():
+    """Charge les nouvelles versions publiées et les échange sans interrompre les requêtes"""
+    swapped = registry.scan()
+    return jsonify({'swapped': bool(swapped), 'models': swapped, 'model': registry.active_version()})
+
+@app.route('/v1/models')
+def models():
+    """Modèles chargés : version, temps de chargement, latences p50/p95/p99 ; comparaison shadow"""
+    return jsonify(registry.stats())
+
+@app.route('/v1/models/active', methods=['POST'])
+def set_active_model():
+    """Bascule le modèle actif : {"name": "creditcard_model"}"""
+    payload = request.get_json(silent=True) or {}
+    try:
+        registry.set_active(payload['name'])
+    except (KeyError, OSError) as e:
+        return jsonify({'error': f"Modèle introuvable : {e}"}), 404
+    return jsonify(registry.stats())
+
+@app.route('/v1/models/shadow', methods=['POST'])
+def set_shadow_model():
+    """Modèle candidat scoré en shadow : {"name": "creditcard_candidate", "rate": 0.1} (name null = arrêt)"""
+    payload = request.get_json(silent=True) or {}
+    rate = payload.get('rate', registry.shadow_rate or 0.1)
+    if not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+        return jsonify({'error': "'rate' doit être compris entre 0 et 1"}), 400
+    try:
+        registry.set_shadow(payload.get('name'), rate)
+    except (KeyError, OSError) as e:
+        return jsonify({'error': f"Modèle introuvable : {e}"}), 404
+    return jsonify(registry.stats())
 
 if __name__ == '__main__':
     print("🚀 Application anti-fraude corrigée démarrée!")
     print("📍 Ouvre ton navigateur sur : http://localhost:5000")
+    store.load()
     app.run(debug=True)
 
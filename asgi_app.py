@@ -0,0 +1,331 @@
+"""Mode de production ASGI pour app_corrige.py : pool d'inférence borné, délais et readiness.
+
+L'application Flask est servie telle quelle (mêmes routes) derrière une couche
+ASGI. La boucle asyncio ne fait que recevoir et renvoyer les requêtes ; chaque
+requête Flask (parsing, features, inférence, rendu) s'exécute dans un pool
+borné de threads :
+
+- au-delà de `workers + queue` requêtes en cours, la réponse est immédiatement
+  `503` avec `Retry-After` (backpressure) au lieu d'allonger la file ;
+- une requête qui dépasse le délai reçoit `504` ; son thread termine son
+  travail avant d'être rendu au pool, qui reste donc borné ;
+- `GET /ready` répond `200` une fois le modèle et le dataset chargés et une
+  première prédiction faite (au démarrage, en arrière-plan), `503` avant ;
+  `GET /live` répond toujours `200`.
+
+Configuration : FRAUDE_ASGI_WORKERS (threads d'inférence, défaut nombre de
+CPU), FRAUDE_ASGI_QUEUE (requêtes en attente, défaut 64),
+FRAUDE_REQUEST_TIMEOUT (secondes, défaut 10). Pour plusieurs CPU, lancer
+plusieurs processus (`--processes`), chacun avec son pool.
+
+    pip install uvicorn
+    python asgi_app.py serve --port 8000 --processes 2
+    python asgi_app.py load http://127.0.0.1:8000/predict --form amount=150 --concurrency 32
+"""
+import argparse
+import asyncio
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import REQUEST_METRICS
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_QUEUE = 64
+DEFAULT_TIMEOUT = 10.0
+# Corps de requête maximal (un lot /v1/score de 10 000 transactions fait ~6 Mo en JSON)
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+
+def wsgi_environ(scope, body):
+    """Environnement WSGI (PEP 3333) d'une requête HTTP ASGI"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Exécute la requête WSGI : (code HTTP, en-têtes, corps)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+def warm_up():
+    """Charge le modèle et le dataset d'app_corrige et fait une première prédiction"""
+    import app_corrige
+    from scoring import score_transaction
+
+    store = app_corrige.store
+    score_transaction(app_corrige.scorer, store.frame(store.template_with()))
+
+
+class FraudeASGI:
+    """Application ASGI : sert une application WSGI via un pool d'inférence borné"""
+
+    def __init__(self, wsgi_app, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE,
+                 timeout=DEFAULT_TIMEOUT, warmup=None):
+        self.wsgi_app = wsgi_app
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.warmup = warmup
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        # Modifié uniquement depuis la boucle asyncio : pas de verrou
+        self.in_flight = 0
+        self.ready = warmup is None
+        self.warmup_seconds = None
+        self.warmup_error = None
+
+    @classmethod
+    def from_env(cls, wsgi_app, warmup=None):
+        return cls(wsgi_app,
+                   workers=int(os.environ.get('FRAUDE_ASGI_WORKERS', DEFAULT_WORKERS)),
+                   queue_size=int(os.environ.get('FRAUDE_ASGI_QUEUE', DEFAULT_QUEUE)),
+                   timeout=float(os.environ.get('FRAUDE_REQUEST_TIMEOUT', DEFAULT_TIMEOUT)),
+                   warmup=warmup)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.warmup is not None:
+                    # Le serveur accepte les connexions pendant le chauffage ; /ready dit quand c'est fini
+                    asyncio.get_running_loop().create_task(self._warm_up())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _warm_up(self):
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.warmup)
+        except Exception as e:
+            self.warmup_error = f'{type(e).__name__}: {e}'
+            return
+        self.warmup_seconds = time.perf_counter() - started
+        self.ready = True
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'warmup_seconds': self.warmup_seconds,
+            'error': self.warmup_error,
+            'in_flight': self.in_flight,
+            'workers': self.workers,
+            'capacity': self.capacity,
+            'timeout_seconds': self.timeout,
+        }
+
+    async def _http(self, scope, receive, send):
+        path = scope['path']
+        if path == '/live':
+            return await _send_json(send, 200, {'live': True})
+        if path == '/ready':
+            return await _send_json(send, 200 if self.ready else 503, self.status())
+
+        if self.in_flight >= self.capacity:
+            REQUEST_METRICS.rejected.inc(('overload',))
+            return await _send_json(send, 503, {'error': 'Serveur saturé, réessayer plus tard'},
+                                    [(b'retry-after', b'1')])
+        self.in_flight += 1
+        released = False
+
+        def release(_=None):
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+
+        try:
+            body = await _read_body(receive)
+        except ValueError:
+            release()
+            REQUEST_METRICS.rejected.inc(('body_too_large',))
+            return await _send_json(send, 413, {'error': 'Corps de requête trop volumineux'})
+
+        loop = asyncio.get_running_loop()
+        future = asyncio.wrap_future(
+            self.executor.submit(call_wsgi, self.wsgi_app, wsgi_environ(scope, body)), loop=loop)
+        # La place n'est rendue que lorsque le thread a fini, même après un 504
+        future.add_done_callback(release)
+        try:
+            status, headers, content = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            REQUEST_METRICS.rejected.inc(('timeout',))
+            return await _send_json(send, 504, {'error': f'Délai de {self.timeout:g}s dépassé'})
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        await send({'type': 'http.response.body', 'body': content})
+
+
+async def _read_body(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise ValueError("corps trop volumineux")
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def _send_json(send, status, payload, extra_headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())] + list(extra_headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def create_app():
+    """Application ASGI d'app_corrige : `uvicorn asgi_app:create_app --factory`"""
+    import app_corrige
+    return FraudeASGI.from_env(app_corrige.app, warmup=warm_up)
+
+
+def load_test(url, concurrency=32, duration=10.0, form=None, json_body=None, timeout=30.0):
+    """Débit et latences d'un endpoint sous `concurrency` clients en boucle pendant `duration` s"""
+    parsed = urllib.parse.urlsplit(url)
+    target = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+    if json_body is not None:
+        body, content_type = json_body.encode('utf-8'), 'application/json'
+    else:
+        body, content_type = urllib.parse.urlencode(form or {}).encode('utf-8'), \
+            'application/x-www-form-urlencoded'
+    method = 'POST' if form or json_body is not None else 'GET'
+    latencies, statuses, lock = [], {}, threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+        local, codes = [], {}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request(method, target, body=body if method == 'POST' else None,
+                                   headers={'Content-Type': content_type})
+                response = connection.getresponse()
+                response.read()
+                code = response.status
+                retry_after = response.getheader('Retry-After') if code == 503 else None
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+                code = 'error'
+                retry_after = None
+            local.append((time.perf_counter() - started) * 1000.0)
+            codes[code] = codes.get(code, 0) + 1
+            if retry_after:
+                # Client poli : attend comme demandé au lieu de marteler un serveur saturé
+                time.sleep(min(float(retry_after), max(0.0, deadline - time.perf_counter())))
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            for code, n in codes.items():
+                statuses[code] = statuses.get(code, 0) + n
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'ok_rps': statuses.get(200, 0) / elapsed,
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur ASGI d'app_corrige et test de charge")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help="Lance uvicorn")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--processes', type=int, default=1, help="Processus uvicorn (un pool chacun)")
+    load = sub.add_parser('load', help="Test de charge d'un endpoint")
+    load.add_argument('url')
+    load.add_argument('--concurrency', type=int, default=32)
+    load.add_argument('--duration', type=float, default=10.0)
+    load.add_argument('--form', action='append', default=[], help="Champ de formulaire clé=valeur")
+    load.add_argument('--json', help="Corps JSON brut")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit("Le mode ASGI nécessite uvicorn (pip install uvicorn)")
+        uvicorn.run('asgi_app:create_app', factory=True, host=args.host, port=args.port,
+                    workers=args.processes, log_level='warning')
+    else:
+        form = dict(field.split('=', 1) for field in args.form)
+        result = load_test(args.url, args.concurrency, args.duration, form=form, json_body=args.json)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+"""Scoring en masse d'un fichier de transactions (CSV ou Parquet), par blocs.
+
+Le fichier d'entrée est lu par blocs de taille fixe : la mémoire reste bornée
+quelle que soit sa taille. Chaque bloc est scoré puis ajouté au fichier de
+sortie (CSV : row, probability, decision, risk_band). Après chaque bloc, un
+point de reprise `<sortie>.ckpt.json` est écrit : une exécution interrompue
+reprend automatiquement là où elle s'était arrêtée.
+
+Avec `--workers N`, les blocs sont lus et scorés par un pool de N processus.
+Le modèle n'est jamais picklé vers les workers : chacun le relit en
+memory-mapping (forêt compilée, ou joblib `mmap_mode='r'`), et les résultats
+sont réassemblés dans l'ordre d'origine des lignes.
+
+    python batch_score.py transactions.csv scores.csv --chunk-size 100000
+    python batch_score.py transactions.csv scores.csv --workers 4 --compiled
+    python batch_score.py creditcard.csv /tmp/scores.csv --bench-workers 1,2,4,8
+"""
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from itertools import islice
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from forest_engine import CompiledForest, compile_forest
+from scoring import score_batch
+
+DEFAULT_MODEL = 'mon_premier_modele_anti_fraude.pkl'
+DEFAULT_CHUNK_SIZE = 100000
+OUTPUT_HEADER = 'row,probability,decision,risk_band\n'
+
+
+def load_scoring_model(path):
+    """Charge un modèle joblib, ou une forêt compilée si `path` est un répertoire"""
+    if os.path.isdir(path):
+        return CompiledForest.load(path)
+    return joblib.load(path)
+
+
+def model_columns(model, fallback):
+    names = getattr(model, 'feature_names_in_', None)
+    if names is not None:
+        return [str(n) for n in names]
+    return [c for c in fallback if c != 'Class']
+
+
+def score_chunk(model, chunk, columns=None):
+    """Score un DataFrame de transactions : (probabilités, décisions, niveaux de risque)"""
+    columns = columns or model_columns(model, chunk.columns)
+    X = chunk[columns].to_numpy(dtype=np.float32)
+    return score_batch(model, pd.DataFrame(X, columns=columns, copy=False))
+
+
+def _input_signature(path):
+    stat = os.stat(path)
+    return {'input': os.path.abspath(path), 'input_size': stat.st_size,
+            'input_mtime_ns': stat.st_mtime_ns}
+
+
+def read_header(f):
+    """Noms de colonnes de la première ligne d'un CSV ouvert en binaire (guillemets retirés).
+
+    Le fichier reste positionné juste après l'en-tête.
+    """
+    return next(csv.reader([f.readline().decode('utf-8')]))
+
+
+def iter_csv_chunks(path, chunk_size, offset=None):
+    """Blocs d'un CSV : (DataFrame, position en octets après le bloc).
+
+    Les lignes sont découpées à la main (sans champ multi-ligne) pour pouvoir
+    reprendre exactement à une position en octets.
+    """
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        if offset is not None:
+            f.seek(offset)
+        while True:
+            lines = list(islice(f, chunk_size))
+            if not lines:
+                return
+            chunk = pd.read_csv(io.BytesIO(b''.join(lines)), names=header, header=None)
+            yield chunk, f.tell()
+
+
+def _parquet_file(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("La lecture de fichiers Parquet nécessite pyarrow (pip install pyarrow)")
+    return pq.ParquetFile(path)
+
+
+def _parquet_start(parquet, start_row):
+    """Premier groupe de lignes à lire et nombre de lignes à y sauter pour reprendre à start_row"""
+    first_group, group_start = 0, 0
+    for i in range(parquet.num_row_groups):
+        n = parquet.metadata.row_group(i).num_rows
+        if group_start + n > start_row:
+            break
+        group_start += n
+        first_group = i + 1
+    return first_group, start_row - group_start
+
+
+def iter_parquet_chunks(path, chunk_size, start_row=0):
+    """Blocs d'un fichier Parquet : (DataFrame, None) ; nécessite pyarrow"""
+    parquet = _parquet_file(path)
+    # Reprise : on saute directement les groupes de lignes déjà traités
+    first_group, to_skip = _parquet_start(parquet, start_row)
+    groups = list(range(first_group, parquet.num_row_groups))
+    if not groups:
+        return
+    for batch in parquet.iter_batches(batch_size=chunk_size, row_groups=groups):
+        chunk = batch.to_pandas()
+        if to_skip:
+            chunk, to_skip = chunk.iloc[to_skip:], max(0, to_skip - len(chunk))
+            if chunk.empty:
+                continue
+        yield chunk, None
+
+
+def read_checkpoint(path, signature):
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if any(checkpoint.get(k) != v for k, v in signature.items()):
+        return None
+    return checkpoint
+
+
+def write_checkpoint(path, checkpoint):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def format_scores(first_row, probabilities, decisions, bands):
+    """Bloc de sortie CSV (octets) pour des lignes consécutives à partir de first_row"""
+    out = pd.DataFrame({
+        'row': np.arange(first_row, first_row + len(probabilities)),
+        'probability': probabilities,
+        'decision': decisions,
+        'risk_band': bands,
+    })
+    return out.to_csv(header=False, index=False).encode('utf-8')
+
+
+def _sequential_results(model, input_path, chunk_size, checkpoint):
+    """Blocs scorés dans le processus courant : (probabilités, décisions, niveaux, position)"""
+    if _is_parquet(input_path):
+        chunks = iter_parquet_chunks(input_path, chunk_size, checkpoint['rows_done'])
+    else:
+        chunks = iter_csv_chunks(input_path, chunk_size, checkpoint['input_offset'])
+    columns = None
+    for chunk, input_offset in chunks:
+        columns = columns or model_columns(model, chunk.columns)
+        yield (*score_chunk(model, chunk, columns), input_offset)
+
+
+# --- Mode parallèle : un pool de processus lit et score des morceaux du fichier ---
+
+_worker_model = None
+
+
+def _init_worker(model_path):
+    global _worker_model
+    # Forêt compilée relue en memory-mapping : ses pages sont partagées entre workers
+    _worker_model = CompiledForest.load(model_path, mmap_mode='r')
+
+
+def _score_csv_range(task):
+    path, header, start, end = task
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    chunk = pd.read_csv(io.BytesIO(data), names=header, header=None)
+    return (*score_chunk(_worker_model, chunk), end)
+
+
+def _score_parquet_range(task):
+    path, group, start, stop, chunk_size = task
+    # Lecture par lots de chunk_size dans le groupe : seuls les lots couvrant [start, stop) sont gardés
+    parts, position = [], 0
+    for batch in _parquet_file(path).iter_batches(batch_size=chunk_size, row_groups=[group]):
+        end = position + batch.num_rows
+        if end > start:
+            first = max(start, position)
+            parts.append(batch.slice(first - position, min(stop, end) - first).to_pandas())
+        position = end
+        if position >= stop:
+            break
+    chunk = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return (*score_chunk(_worker_model, chunk), None)
+
+
+def csv_tasks(path, chunk_size, offset=None):
+    """Découpe un CSV en plages d'octets alignées sur les lignes (~chunk_size lignes chacune)"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        start = f.tell() if offset is None else offset
+        # Taille moyenne d'une ligne estimée sur le début du fichier
+        f.seek(start)
+        sample = list(islice(f, 1000))
+        if not sample:
+            return
+        step = max(1, sum(map(len, sample)) // len(sample) * chunk_size)
+        while start < size:
+            f.seek(min(start + step, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield (path, header, start, end)
+            start = end
+
+
+def parquet_tasks(path, chunk_size, start_row=0):
+    """Découpe chaque groupe de lignes Parquet en plages de chunk_size lignes"""
+    parquet = _parquet_file(path)
+    first_group, skip = _parquet_start(parquet, start_row)
+    for group in range(first_group, parquet.num_row_groups):
+        n = parquet.metadata.row_group(group).num_rows
+        start = skip if group == first_group else 0
+        # Plages alignées sur les lots de lecture (sauf la première d'une reprise)
+        for stop in range((start // chunk_size + 1) * chunk_size, n + chunk_size, chunk_size):
+            yield (path, group, start, min(stop, n), chunk_size)
+            start = stop
+
+
+def _shared_model_path(model_path, tmp):
+    """Répertoire de forêt compilée pour les workers : joblib recopie les arbres sklearn
+    dans chaque processus, alors que les tableaux de la forêt compilée sont partagés"""
+    if os.path.isdir(model_path):
+        return model_path
+    return compile_forest(joblib.load(model_path)).save(os.path.join(tmp, 'forest'))
+
+
+def _parallel_results(model_path, input_path, chunk_size, checkpoint, workers):
+    """Résultats des workers, dans l'ordre des lignes, avec au plus 2 morceaux en vol par worker"""
+    if _is_parquet(input_path):
+        tasks, fn = parquet_tasks(input_path, chunk_size, checkpoint['rows_done']), _score_parquet_range
+    else:
+        tasks, fn = csv_tasks(input_path, chunk_size, checkpoint['input_offset']), _score_csv_range
+    with tempfile.TemporaryDirectory() as tmp, \
+            multiprocessing.Pool(workers, initializer=_init_worker,
+                                 initargs=(_shared_model_path(model_path, tmp),)) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(fn, (task,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def _is_parquet(path):
+    return path.endswith(('.parquet', '.pq'))
+
+
+def score_file(input_path, output_path, model=None, chunk_size=DEFAULT_CHUNK_SIZE,
+               restart=False, workers=0, model_path=None, log=sys.stderr):
+    """Score `input_path` vers `output_path`, avec reprise sur point de contrôle.
+
+    Avec workers=0 le scoring se fait dans le processus courant avec `model` ;
+    sinon un pool de `workers` processus charge `model_path` en memory-mapping
+    (un modèle joblib est d'abord compilé une fois en forêt NumPy).
+    Retourne un dict de statistiques (lignes, durée, lignes/s).
+    """
+    checkpoint_path = f'{output_path}.ckpt.json'
+    signature = _input_signature(input_path)
+    checkpoint = None if restart else read_checkpoint(checkpoint_path, signature)
+    if checkpoint is None:
+        checkpoint = {**signature, 'rows_done': 0, 'input_offset': None, 'output_bytes': 0}
+    else:
+        print(f"Reprise à la ligne {checkpoint['rows_done']:,}", file=log)
+
+    if workers:
+        results = _parallel_results(model_path, input_path, chunk_size, checkpoint, workers)
+    else:
+        results = _sequential_results(model, input_path, chunk_size, checkpoint)
+
+    mode = 'r+b' if checkpoint['output_bytes'] and os.path.exists(output_path) else 'wb'
+    started = time.perf_counter()
+    rows_scored = 0
+    with open(output_path, mode) as out:
+        if mode == 'r+b':
+            # Écarte ce qui a pu être écrit après le dernier point de contrôle
+            out.truncate(checkpoint['output_bytes'])
+            out.seek(checkpoint['output_bytes'])
+        else:
+            out.write(OUTPUT_HEADER.encode('utf-8'))
+        for probabilities, decisions, bands, input_offset in results:
+            out.write(format_scores(checkpoint['rows_done'], probabilities, decisions, bands))
+            out.flush()
+            os.fsync(out.fileno())
+
+            rows_scored += len(probabilities)
+            checkpoint.update(rows_done=checkpoint['rows_done'] + len(probabilities),
+                              input_offset=input_offset, output_bytes=out.tell())
+            write_checkpoint(checkpoint_path, checkpoint)
+            elapsed = time.perf_counter() - started
+            print(f"{checkpoint['rows_done']:,} lignes scorées "
+                  f"({rows_scored / elapsed:,.0f} lignes/s)", file=log)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': checkpoint['rows_done'],
+        'rows_this_run': rows_scored,
+        'seconds': elapsed,
+        'rows_per_second': rows_scored / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def benchmark_workers(input_path, model_path, worker_counts, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Débit (lignes/s) du scoring complet de input_path pour chaque nombre de workers"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as quiet:
+        output = os.path.join(tmp, 'scores.csv')
+        for workers in worker_counts:
+            stats = score_file(input_path, output, chunk_size=chunk_size, restart=True,
+                               workers=workers, model_path=model_path, log=quiet)
+            results[workers] = stats['rows_per_second']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scoring en masse d'un fichier de transactions")
+    parser.add_argument('input', help="Fichier CSV ou Parquet (.parquet)")
+    parser.add_argument('output', help="Fichier CSV de sortie")
+    parser.add_argument('--model', default=DEFAULT_MODEL,
+                        help="Modèle joblib ou répertoire de forêt compilée")
+    parser.add_argument('--compiled', action='store_true',
+                        help="Compile la forêt sklearn avant de scorer (forest_engine ; "
+                             "toujours fait avec --workers)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore le point de reprise et recommence depuis le début")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Nombre de processus de scoring (0 = processus courant)")
+    parser.add_argument('--bench-workers',
+                        help="Mesure le débit pour plusieurs nombres de workers, ex. 1,2,4,8")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model
+        if args.compiled and not os.path.isdir(model_path):
+            # Les workers memory-mappent la forêt compilée au lieu de recevoir une copie
+            model_path = compile_forest(joblib.load(model_path)).save(os.path.join(tmp, 'forest'))
+
+        if args.bench_workers:
+            counts = [int(n) for n in args.bench_workers.split(',')]
+            results = benchmark_workers(args.input, model_path, counts, args.chunk_size)
+            base = results[counts[0]]
+            print(f"{'Workers':>8}{'Lignes/s':>14}{'Accélération':>14}")
+            for workers, rate in results.items():
+                print(f"{workers:>8}{rate:>14,.0f}{rate / base:>13.2f}x")
+            return
+
+        model = None if args.workers else load_scoring_model(model_path)
+        stats = score_file(args.input, args.output, model, chunk_size=args.chunk_size,
+                           restart=args.restart, workers=args.workers, model_path=model_path)
+    print(f"Terminé : {stats['rows']:,} lignes, {stats['rows_this_run']:,} scorées en "
+          f"{stats['seconds']:.1f}s ({stats['rows_per_second']:,.0f} lignes/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""Benchmarks reproductibles des chemins de scoring, résultats en JSON.
+
+Pour chaque jeu de données (creditcard.csv et données synthétiques de
+synthetic_data.py) et chaque moteur (sklearn, forêt compilée, forêt compacte, micro-batcher) :
+
+- chargement du modèle et première prédiction à froid, dans des processus neufs
+  (p50/p95/p99 sur `--cold-runs` démarrages) ;
+- latence unitaire à chaud (p50/p95/p99), comme les applications : une ligne
+  DataFrame passée à score_transaction ;
+- débit par lot (lignes/s) pour plusieurs tailles de lot ;
+- surcoût HTTP des routes Flask d'app_corrige.py (/v1/score, /predict) par
+  rapport au même scoring appelé directement.
+
+Les résultats sont écrits en JSON avec le commit git et les versions des
+bibliothèques ; `--compare` signale les régressions par rapport à un run précédent.
+
+    python benchmark.py
+    python benchmark.py --quick --datasets synthetic
+    python benchmark.py --compare benchmarks/<ancien commit>.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+from forest_engine import compact_forest, compile_forest
+from micro_batcher import MicroBatcher
+from model_store import CREDITCARD_MODEL, artifact_path, current_artifact_path, load_artifact, load_or_build
+from scoring import score_batch, score_transaction
+from synthetic_data import FEATURE_COLUMNS, TRAINING_PARAMS, fit_fraud_model, generate_fraud_frame
+
+FORMAT_VERSION = 1
+DEFAULT_OUTPUT_DIR = 'benchmarks'
+DATASETS = ('creditcard', 'synthetic')
+BATCH_SIZES = (1, 10, 100, 1000, 10000)
+CREDITCARD_CSV = 'creditcard.csv'
+CREDITCARD_PICKLE = 'mon_premier_modele_anti_fraude.pkl'
+CREDITCARD_COLUMNS = ['Time'] + [f'V{i}' for i in range(1, 29)] + ['Amount']
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Processus neuf : chargement du modèle puis première prédiction (le reste n'est pas chronométré)
+_COLD_PROBE = """
+import json, sys, time
+sys.path.insert(0, {here!r})
+import numpy as np
+import pandas as pd
+from scoring import score_transaction
+{imports}
+row = pd.DataFrame(np.load({row_path!r}), columns={columns!r})
+start = time.perf_counter()
+{load}
+loaded = time.perf_counter()
+score_transaction(model, row)
+first = time.perf_counter()
+score_transaction(model, row)
+second = time.perf_counter()
+print(json.dumps({{'load_seconds': loaded - start, 'first_ms': (first - loaded) * 1000.0,
+                   'second_ms': (second - first) * 1000.0}}))
+"""
+_LOADERS = {
+    'pickle': ("import joblib", "model = joblib.load({path!r})"),
+    'artifact': ("from model_store import load_artifact", "model = load_artifact({path!r})['model']"),
+    'compiled': ("from forest_engine import CompiledForest", "model = CompiledForest.load({path!r})"),
+}
+
+
+def git_revision():
+    """(commit, arbre modifié ?) du dépôt, ou (None, None) hors de git"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=HERE,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def environment():
+    commit, dirty = git_revision()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def percentiles(values_ms):
+    p50, p95, p99 = np.percentile(np.asarray(values_ms, dtype=np.float64), [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+
+def creditcard_like_frame(n_rows, seed=0):
+    """Lignes de même forme que creditcard.csv (Time, V1..V28, Amount), si le CSV est absent"""
+    rng = np.random.default_rng(seed)
+    data = {'Time': rng.uniform(0, 172792, n_rows)}
+    data.update({f'V{i}': rng.standard_normal(n_rows) for i in range(1, 29)})
+    data['Amount'] = np.round(np.exp(rng.normal(3.0, 1.5, n_rows)), 2)
+    return pd.DataFrame(data)
+
+
+def load_creditcard(n_rows, seed=0):
+    """(chemin du modèle, type de chargeur, modèle, lignes de test, source des lignes)"""
+    path = current_artifact_path(CREDITCARD_MODEL)
+    loader = 'artifact'
+    if path is None:
+        if not os.path.exists(CREDITCARD_PICKLE):
+            return None
+        path, loader = CREDITCARD_PICKLE, 'pickle'
+    model = load_artifact(path)['model'] if loader == 'artifact' else joblib.load(path)
+    columns = list(getattr(model, 'feature_names_in_', CREDITCARD_COLUMNS))
+    if os.path.exists(CREDITCARD_CSV):
+        from csv_cache import load_frame
+        frame = load_frame(CREDITCARD_CSV)
+        rows = np.random.default_rng(seed).choice(len(frame), min(n_rows, len(frame)), replace=False)
+        X, source = frame.iloc[np.sort(rows)][columns].reset_index(drop=True), CREDITCARD_CSV
+    else:
+        X, source = creditcard_like_frame(n_rows, seed)[columns], 'creditcard_like_frame'
+    return path, loader, model, X.astype(np.float64), source
+
+
+def load_synthetic(n_rows, seed=0):
+    # Même artefact que le modèle d'app.py (mêmes paramètres, même découpage apprentissage / test)
+    artifact = load_or_build('fraud_model', TRAINING_PARAMS, fit_fraud_model)
+    path = artifact_path('fraud_model', artifact['key'])
+    X = generate_fraud_frame(n_rows, seed=seed + 1)[FEATURE_COLUMNS].astype(np.float64)
+    return path, 'artifact', artifact['model'], X, 'generate_fraud_frame'
+
+
+def cold_start(loader, path, X, runs):
+    """Chargement et première prédiction dans `runs` processus neufs"""
+    imports, load = _LOADERS[loader]
+    with tempfile.TemporaryDirectory() as tmp:
+        row_path = os.path.join(tmp, 'row.npy')
+        np.save(row_path, X.iloc[:1].to_numpy())
+        script = _COLD_PROBE.format(here=HERE, imports=imports, row_path=row_path,
+                                    columns=list(X.columns), load=load.format(path=os.path.abspath(path)))
+        probes = []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                    check=True, cwd=os.getcwd())
+            probes.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    load_ms = [p['load_seconds'] * 1000.0 for p in probes]
+    return {
+        'runs': runs,
+        'load': percentiles(load_ms),
+        'first_prediction': percentiles([p['first_ms'] for p in probes]),
+        'second_prediction': percentiles([p['second_ms'] for p in probes]),
+    }
+
+
+def warm_latency(model, X, n_calls, warmup=20):
+    """Latence d'une transaction (DataFrame d'une ligne) après échauffement"""
+    rows = [X.iloc[i % len(X):i % len(X) + 1] for i in range(n_calls + warmup)]
+    for row in rows[:warmup]:
+        score_transaction(model, row)
+    timings = []
+    for row in rows[warmup:]:
+        start = time.perf_counter()
+        score_transaction(model, row)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return {'calls': n_calls, **percentiles(timings)}
+
+
+def batch_throughput(model, X, sizes, min_seconds=0.5, min_repeats=3):
+    """Lignes/s de score_batch pour chaque taille de lot (répété au moins min_seconds)"""
+    results = {}
+    for size in sizes:
+        if size > len(X):
+            continue
+        batch = X.iloc[:size]
+        score_batch(model, batch)
+        timings = []
+        while len(timings) < min_repeats or sum(timings) < min_seconds:
+            start = time.perf_counter()
+            score_batch(model, batch)
+            timings.append(time.perf_counter() - start)
+        results[str(size)] = {'repeats': len(timings), 'batch_p50_ms': float(np.median(timings) * 1000.0),
+                              'rows_per_second': size * len(timings) / sum(timings)}
+    return results
+
+
+def http_overhead(X, n_calls, batch_size=100):
+    """Latence des routes Flask d'app_corrige.py et surcoût par rapport au scoring direct"""
+    os.environ['FRAUDE_WATCH_INTERVAL'] = '0'  # pas de thread de surveillance pendant la mesure
+    os.environ.setdefault('FRAUDE_MICRO_BATCH', '0')
+    try:
+        import app_corrige
+    except ImportError as e:
+        return {'skipped': f"app_corrige indisponible : {e}"}
+    client = app_corrige.app.test_client()
+    model = app_corrige.registry.model
+    columns = app_corrige.feature_columns()
+    if list(X.columns) != list(columns):
+        return {'skipped': "features différentes de celles du modèle d'app_corrige"}
+
+    def timed_route(send, direct, n):
+        send(), direct()
+        route, base = [], []
+        for _ in range(n):
+            start = time.perf_counter()
+            response = send()
+            route.append((time.perf_counter() - start) * 1000.0)
+            if response.status_code != 200:
+                raise RuntimeError(f"Réponse HTTP {response.status_code} : {response.data[:200]!r}")
+            start = time.perf_counter()
+            direct()
+            base.append((time.perf_counter() - start) * 1000.0)
+        route, base = percentiles(route), percentiles(base)
+        return {'route': route, 'direct': base, 'overhead_p50_ms': route['p50_ms'] - base['p50_ms']}
+
+    results = {}
+    for rows in (1, batch_size):
+        batch = X.iloc[:rows]
+        # Corps JSON encodé une fois : seul le travail du serveur est mesuré
+        body = json.dumps({'columns': {c: batch[c].tolist() for c in columns}})
+        results[f'/v1/score[{rows}]'] = timed_route(
+            lambda: client.post('/v1/score', data=body, content_type='application/json'),
+            lambda: score_batch(model, batch), n_calls)
+    if os.path.exists(CREDITCARD_CSV):
+        template = app_corrige.store.frame(app_corrige.store.template_with(Amount=150.0))
+        results['/predict'] = timed_route(lambda: client.post('/predict', data={'amount': '150.0'}),
+                                          lambda: score_transaction(model, template), n_calls)
+    return results
+
+
+def bench_dataset(name, args):
+    load = load_creditcard if name == 'creditcard' else load_synthetic
+    loaded = load(max(args.rows, max(args.batch_sizes)), seed=args.seed)
+    if loaded is None:
+        return {'skipped': f"ni modèle publié ni {CREDITCARD_PICKLE}"}
+    path, loader, model, X, source = loaded
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        compiled = compile_forest(model)
+        compile_seconds = time.perf_counter() - started
+        compiled_path = compiled.save(os.path.join(tmp, 'forest'))
+        compact = compact_forest(compiled)
+        compact_path = compact.save(os.path.join(tmp, 'compact'))
+        engines = {
+            'sklearn': {'model': model, 'cold': (loader, path)},
+            'compiled': {'model': compiled, 'cold': ('compiled', compiled_path)},
+            'compact': {'model': compact, 'cold': ('compiled', compact_path)},
+            'micro_batch': {'model': MicroBatcher(model)},
+        }
+        results = {'source': source, 'rows': len(X), 'n_features': X.shape[1], 'model': os.path.basename(path),
+                   'n_estimators': compiled.n_estimators, 'compile_seconds': compile_seconds, 'engines': {}}
+        for engine_name, engine in engines.items():
+            print(f"[{name}] {engine_name}...", file=sys.stderr)
+            entry = {'warm': warm_latency(engine['model'], X, args.warm_calls)}
+            if 'cold' in engine:
+                entry['cold'] = cold_start(*engine['cold'], X, args.cold_runs)
+                entry['batch'] = batch_throughput(engine['model'], X, args.batch_sizes,
+                                                  min_seconds=args.min_seconds)
+            else:
+                engine['model'].close()
+            results['engines'][engine_name] = entry
+    if name == 'creditcard' and not args.no_http:
+        print(f"[{name}] http...", file=sys.stderr)
+        results['http'] = http_overhead(X, args.http_calls)
+    return results
+
+
+def flatten(results, prefix=''):
+    """{'creditcard.sklearn.warm.p50_ms': valeur, ...} des métriques numériques comparables"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and name.endswith(('_ms', '_seconds', 'rows_per_second')):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(old, new, threshold=0.1):
+    """Métriques communes aux deux runs : (nom, ancien, nouveau, variation, régression ?)"""
+    old_flat, new_flat = flatten(old['datasets']), flatten(new['datasets'])
+    rows = []
+    for name in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[name], new_flat[name]
+        if before <= 0:
+            continue
+        change = after / before - 1
+        # Débit : plus haut est mieux ; latences et durées : plus bas est mieux
+        worse = -change if name.endswith('rows_per_second') else change
+        rows.append((name, before, after, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins de scoring (JSON)")
+    parser.add_argument('--datasets', default=','.join(DATASETS), help="creditcard,synthetic")
+    parser.add_argument('--rows', type=int, default=10000, help="Lignes de test par jeu de données")
+    parser.add_argument('--warm-calls', type=int, default=1000)
+    parser.add_argument('--cold-runs', type=int, default=5, help="Processus neufs pour les mesures à froid")
+    parser.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)))
+    parser.add_argument('--min-seconds', type=float, default=0.5, help="Durée minimale par taille de lot")
+    parser.add_argument('--http-calls', type=int, default=200)
+    parser.add_argument('--no-http', action='store_true', help="Sans les routes Flask")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--quick', action='store_true', help="Mesures réduites (vérification rapide)")
+    parser.add_argument('--output', help=f"Fichier JSON (défaut : {DEFAULT_OUTPUT_DIR}/<commit>.json)")
+    parser.add_argument('--compare', help="JSON d'un run précédent à comparer")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Variation défavorable au-delà de laquelle une métrique est une régression")
+    args = parser.parse_args()
+    args.batch_sizes = [int(n) for n in args.batch_sizes.split(',')]
+    if args.quick:
+        args.rows, args.warm_calls, args.cold_runs = 2000, 200, 2
+        args.http_calls, args.min_seconds = 50, 0.1
+        args.batch_sizes = [n for n in args.batch_sizes if n <= 1000]
+
+    report = {'format_version': FORMAT_VERSION, 'environment': environment(),
+              'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+              'datasets': {}}
+    for name in args.datasets.split(','):
+        report['datasets'][name] = bench_dataset(name, args)
+
+    output = args.output
+    if output is None:
+        commit = report['environment']['commit'] or 'nogit'
+        suffix = '-dirty' if report['environment']['dirty'] else ''
+        output = os.path.join(DEFAULT_OUTPUT_DIR, f'{commit[:12]}{suffix}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, results in report['datasets'].items():
+        if 'skipped' in results:
+            print(f"{name} : ignoré ({results['skipped']})")
+            continue
+        print(f"\n{name} ({results['source']}, {results['n_estimators']} arbres)")
+        print(f"{'Moteur':>12}{'p50':>9}{'p95':>9}{'p99':>9}{'Froid':>10}{'Chargement':>12}  Débit max")
+        for engine_name, entry in results['engines'].items():
+            warm = entry['warm']
+            cold = entry.get('cold')
+            best = max((b['rows_per_second'] for b in entry.get('batch', {}).values()), default=None)
+            print(f"{engine_name:>12}{warm['p50_ms']:>7.2f}ms{warm['p95_ms']:>7.2f}ms{warm['p99_ms']:>7.2f}ms"
+                  + (f"{cold['first_prediction']['p50_ms']:>8.1f}ms{cold['load']['p50_ms']:>10.0f}ms"
+                     if cold else f"{'-':>10}{'-':>12}")
+                  + (f"  {best:,.0f} lignes/s" if best else ''))
+        for route, r in results.get('http', {}).items():
+            if isinstance(r, dict):
+                print(f"{route:>20} : p50 {r['route']['p50_ms']:.2f} ms "
+                      f"(surcoût HTTP {r['overhead_p50_ms']:+.2f} ms)")
+            else:
+                print(f"HTTP : {r}")
+    print(f"\nRésultats : {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.threshold)
+        regressions = [r for r in rows if r[4]]
+        print(f"\nComparaison avec {baseline['environment'].get('commit') or args.compare} : "
+              f"{len(rows)} métriques, {len(regressions)} régression(s) > {args.threshold:.0%}")
+        for name, before, after, change, _ in regressions:
+            print(f"  {name} : {before:.4g} -> {after:.4g} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Cache des graphiques matplotlib rendus côté serveur.
+
+Le rendu matplotlib est le principal coût CPU d'une page Streamlit, et les
+figures affichées avec st.pyplot n'étaient jamais fermées. Ici chaque
+graphique est rendu une fois en PNG (ou SVG), puis servi depuis un cache LRU
+indexé par (type de graphique, empreinte des données, paramètres). La figure
+est fermée juste après le rendu.
+
+    png = chart_cache.render('heatmap', fingerprint, {'bins': 30}, draw_heatmap)
+    st.image(png, width='stretch')
+"""
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+
+# Limites du cache : nombre d'images et taille totale en octets
+MAX_ENTRIES = 64
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def _freeze(value):
+    """Paramètres rendus hashables (dict, listes, tableaux) pour servir de clé"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if hasattr(value, 'tolist'):
+        return _freeze(value.tolist())
+    return value
+
+
+class ChartCache:
+    """LRU d'images rendues, avec statistiques de hits / misses"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, fmt='png', dpi=100):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.fmt = fmt
+        self.dpi = dpi
+        self._images = OrderedDict()
+        self._bytes = 0
+        # pyplot n'est pas thread-safe : un seul rendu à la fois dans le processus
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._render_seconds = 0.0
+
+    def _evict(self):
+        while self._images and (len(self._images) > self.max_entries or self._bytes > self.max_bytes):
+            _, image = self._images.popitem(last=False)
+            self._bytes -= len(image)
+            self._evictions += 1
+
+    def _render(self, draw):
+        fig = draw()
+        try:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=self.fmt, dpi=self.dpi, bbox_inches='tight')
+            return buffer.getvalue()
+        finally:
+            plt.close(fig)
+
+    def render(self, chart, fingerprint, params, draw):
+        """Image du graphique `chart` ; `draw()` construit la figure et n'est appelé qu'en cas de miss.
+
+        `fingerprint` identifie les données (None si tout est dans `params`).
+        """
+        key = (chart, fingerprint, _freeze(params), self.fmt, self.dpi)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self._hits += 1
+                return image
+            self._misses += 1
+            start = time.perf_counter()
+            image = self._render(draw)
+            self._render_seconds += time.perf_counter() - start
+            self._images[key] = image
+            self._bytes += len(image)
+            self._evict()
+            return image
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'entries': len(self._images),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else 0.0,
+                'evictions': self._evictions,
+                'render_seconds': self._render_seconds,
+            }
+
+
+# Cache partagé par toutes les pages et sessions du processus
+default_cache = ChartCache()
+
+
+def render(chart, fingerprint, params, draw):
+    return default_cache.render(chart, fingerprint, params, draw)
+
+
+def stats():
+    return default_cache.stats()
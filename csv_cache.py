@@ -0,0 +1,228 @@
+"""Cache binaire en colonnes de creditcard.csv, chargé par memory-mapping.
+
+Le CSV est converti une seule fois en un fichier .npy par colonne (plus une
+matrice float32 des features, prête pour le scoring) dans un répertoire
+voisin `.creditcard.csv.npycache/`. Le cache est invalidé dès que la date
+de modification ou la taille du CSV changent. Au chargement, les fichiers
+sont memory-mappés : le démarrage est quasi instantané et plusieurs
+processus partagent les mêmes pages.
+
+    python csv_cache.py creditcard.csv            # construit (ou valide) le cache
+    python csv_cache.py creditcard.csv --report   # compare read_csv et le cache
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+LABEL_COLUMN = 'Class'
+FEATURES_FILE = 'features.f32.npy'
+
+_build_lock = threading.Lock()
+
+
+def cache_dir(csv_path):
+    head, tail = os.path.split(os.path.abspath(csv_path))
+    return os.path.join(head, f'.{tail}.npycache')
+
+
+def _column_file(column):
+    return f'col_{column}.npy'
+
+
+def _csv_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'csv_mtime_ns': stat.st_mtime_ns, 'csv_size': stat.st_size}
+
+
+def read_meta(csv_path):
+    try:
+        with open(os.path.join(cache_dir(csv_path), 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(csv_path):
+    """Vrai si le cache existe et correspond au CSV actuel (mtime + taille)"""
+    meta = read_meta(csv_path)
+    if meta is None or meta.get('format_version') != FORMAT_VERSION:
+        return False
+    signature = _csv_signature(csv_path)
+    return all(meta.get(k) == v for k, v in signature.items())
+
+
+def _install(tmp, target, csv_path):
+    """Met le cache construit dans `tmp` à la place de `target`.
+
+    Si un autre processus a déjà installé un cache à jour (premières
+    constructions simultanées), il est gardé tel quel ; seul un cache périmé
+    est écarté, jamais supprimé avant que le nouveau ne soit en place.
+    """
+    try:
+        # Réussit si `target` n'existe pas encore
+        os.replace(tmp, target)
+        return
+    except OSError:
+        if is_fresh(csv_path):
+            return
+    stale = f'{target}.old-{os.getpid()}'
+    os.replace(target, stale)
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        if not is_fresh(csv_path):
+            raise
+    finally:
+        shutil.rmtree(stale, ignore_errors=True)
+
+
+def build_cache(csv_path, label_column=LABEL_COLUMN):
+    """Convertit le CSV en colonnes .npy (écriture dans un répertoire temporaire puis renommage)"""
+    signature = _csv_signature(csv_path)
+    df = pd.read_csv(csv_path)
+    target = cache_dir(csv_path)
+    tmp = f'{target}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        for column in df.columns:
+            np.save(os.path.join(tmp, _column_file(column)), np.ascontiguousarray(df[column].to_numpy()))
+        feature_columns = [c for c in df.columns if c != label_column]
+        np.save(os.path.join(tmp, FEATURES_FILE),
+                np.ascontiguousarray(df[feature_columns].to_numpy(dtype=np.float32)))
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'columns': list(df.columns),
+            'feature_columns': feature_columns,
+            'label_column': label_column,
+            'n_rows': len(df),
+            **signature,
+        }
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        _install(tmp, target, csv_path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return meta
+
+
+def fingerprint(csv_path):
+    """Empreinte du dataset (chemin, mtime, taille), sans relire les données"""
+    signature = _csv_signature(csv_path)
+    blob = f"{os.path.abspath(csv_path)}:{signature['csv_mtime_ns']}:{signature['csv_size']}"
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()[:16]
+
+
+def ensure_cache(csv_path):
+    """Retourne les métadonnées du cache, en le (re)construisant si le CSV a changé"""
+    with _build_lock:
+        if not is_fresh(csv_path):
+            return build_cache(csv_path)
+        return read_meta(csv_path)
+
+
+def load_columns(csv_path, columns=None, mmap_mode='r'):
+    """Colonnes memory-mappées : {nom: tableau}"""
+    meta = ensure_cache(csv_path)
+    directory = cache_dir(csv_path)
+    return {c: np.load(os.path.join(directory, _column_file(c)), mmap_mode=mmap_mode)
+            for c in (columns or meta['columns'])}
+
+
+def load_frame(csv_path, mmap_mode='r'):
+    """DataFrame adossé aux colonnes memory-mappées (équivalent de pd.read_csv, sans copie)"""
+    return pd.DataFrame(load_columns(csv_path, mmap_mode=mmap_mode), copy=False)
+
+
+def load_feature_matrix(csv_path, columns=None, mmap_mode='r'):
+    """Matrice (n, n_features) float32 contiguë dans l'ordre `columns`.
+
+    Dans l'ordre du CSV, elle est memory-mappée directement ; un autre ordre
+    nécessite une copie réordonnée.
+    """
+    meta = ensure_cache(csv_path)
+    if columns is None or list(columns) == meta['feature_columns']:
+        return np.load(os.path.join(cache_dir(csv_path), FEATURES_FILE), mmap_mode=mmap_mode)
+    data = load_columns(csv_path, list(columns), mmap_mode=mmap_mode)
+    return np.ascontiguousarray(np.column_stack([data[c] for c in columns]), dtype=np.float32)
+
+
+_PROBE = """
+import json, sys, time
+{setup}
+start = time.perf_counter()
+{load}
+elapsed = time.perf_counter() - start
+rss = None
+try:
+    # VmHWM (pic de RSS) est remis à zéro à l'exec, contrairement à ru_maxrss
+    with open('/proc/self/status') as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+except (OSError, StopIteration):
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            rss //= 1024
+    except ImportError:
+        pass
+print(json.dumps({{'seconds': elapsed, 'max_rss_kb': rss}}))
+"""
+
+
+def _probe(setup, load):
+    result = subprocess.run([sys.executable, '-c', _PROBE.format(setup=setup, load=load)],
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def report(csv_path):
+    """Temps de chargement et RSS max, read_csv contre cache memory-mappé (processus séparés)"""
+    csv_path = os.path.abspath(csv_path)
+    ensure_cache(csv_path)
+    setup = "import pandas as pd; import csv_cache"
+    baseline = _probe(setup, "pass")
+    runs = {
+        'pd.read_csv': _probe(setup, f"df = pd.read_csv({csv_path!r})"),
+        'csv_cache.load_frame': _probe(setup, f"df = csv_cache.load_frame({csv_path!r})"),
+        'csv_cache.load_feature_matrix': _probe(
+            setup, f"X = csv_cache.load_feature_matrix({csv_path!r})"),
+    }
+    return baseline, runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache binaire en colonnes de creditcard.csv")
+    parser.add_argument('csv', nargs='?', default='creditcard.csv')
+    parser.add_argument('--rebuild', action='store_true', help="Force la reconstruction du cache")
+    parser.add_argument('--report', action='store_true', help="Compare read_csv et le cache")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        meta = build_cache(args.csv)
+    else:
+        meta = ensure_cache(args.csv)
+    print(f"Cache {cache_dir(args.csv)} : {meta['n_rows']:,} lignes, {len(meta['columns'])} colonnes")
+
+    if args.report:
+        baseline, runs = report(args.csv)
+        print(f"{'Chargement':<32}{'Temps':>10}{'RSS max':>12}")
+        for name, r in runs.items():
+            rss = f"{r['max_rss_kb'] / 1024:.0f} Mo" if r['max_rss_kb'] else 'n/a'
+            print(f"{name:<32}{r['seconds']:>9.3f}s{rss:>12}")
+        if baseline['max_rss_kb']:
+            print(f"(processus Python + pandas seul : {baseline['max_rss_kb'] / 1024:.0f} Mo)")
+
+
+if __name__ == '__main__':
+    main()
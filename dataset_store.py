@@ -0,0 +1,97 @@
+"""Stockage en mémoire du dataset creditcard.csv, partagé par tout le processus"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+import csv_cache
+
+DATASET_PATH = 'creditcard.csv'
+LABEL_COLUMN = 'Class'
+
+
+class DatasetStore:
+    """Charge le CSV une seule fois et garde les features dans une matrice float32 contiguë.
+
+    Le float32 ne change pas les prédictions : les arbres de scikit-learn
+    convertissent de toute façon les entrées en float32 avant de les parcourir.
+    Les données viennent du cache binaire de csv_cache (memory-mappé).
+    """
+
+    def __init__(self, path=DATASET_PATH, label_column=LABEL_COLUMN, columns=None):
+        self.path = path
+        self.label_column = label_column
+        self._requested_columns = list(columns) if columns is not None else None
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.columns = None
+        self.features = None
+        self.labels = None
+        self.template = None
+        self._column_index = {}
+
+    def load(self):
+        """Charge le dataset au premier appel (thread-safe), ne fait rien ensuite"""
+        if self._loaded:
+            return self
+        with self._lock:
+            if self._loaded:
+                return self
+            meta = csv_cache.ensure_cache(self.path)
+            columns = self._requested_columns
+            if columns is None:
+                columns = [c for c in meta['columns'] if c != self.label_column]
+            missing = [c for c in columns if c not in meta['columns']]
+            if missing:
+                raise ValueError(f"Colonnes absentes de {self.path} : {missing}")
+
+            self.columns = list(columns)
+            self._column_index = {c: i for i, c in enumerate(self.columns)}
+            self.features = csv_cache.load_feature_matrix(self.path, self.columns)
+            self.labels = csv_cache.load_columns(self.path, [self.label_column])[self.label_column]
+            # Ligne modèle utilisée par /predict (équivalent de iloc[0:1])
+            self.template = np.array(self.features[0:1])
+            self.template.setflags(write=False)
+            self._loaded = True
+        return self
+
+    @property
+    def n_rows(self):
+        return len(self.load().features)
+
+    def column_index(self, column):
+        self.load()
+        return self._column_index[column]
+
+    def frame(self, rows):
+        """Enveloppe un tableau (n, n_features) dans un DataFrame avec les noms de colonnes"""
+        self.load()
+        return pd.DataFrame(np.atleast_2d(rows), columns=self.columns, copy=False)
+
+    def template_with(self, **values):
+        """Copie de la ligne modèle avec certaines colonnes remplacées"""
+        self.load()
+        row = self.template.copy()
+        for column, value in values.items():
+            row[0, self._column_index[column]] = value
+        return row
+
+    def sample(self):
+        """Tire une transaction au hasard : (features (1, n_features), vraie classe)"""
+        self.load()
+        i = np.random.randint(len(self.features))
+        return self.features[i:i + 1], int(self.labels[i])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=DATASET_PATH, columns=None):
+    """Retourne le DatasetStore du processus pour ce fichier (créé une seule fois)"""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = DatasetStore(path, columns=columns)
+            _stores[path] = store
+        return store
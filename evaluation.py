@@ -0,0 +1,175 @@
+"""Évaluation d'un modèle sur le jeu de test, pour n'importe quel seuil de décision.
+
+Le jeu de test est scoré une seule fois par version du modèle ; les
+probabilités sont triées et les vrais / faux positifs cumulés (O(n log n)).
+Ensuite, la matrice de confusion, la précision, le rappel... d'un seuil
+quelconque ne coûtent qu'une recherche dichotomique (O(log n)), et les courbes
+ROC et précision-rappel se lisent directement dans les cumuls. Un curseur de
+seuil se met donc à jour instantanément.
+
+    evaluation = get_evaluation(model_key, forest, X_test, y_test)
+    evaluation.at(0.3)['recall']
+    fpr, tpr, thresholds = evaluation.roc()
+
+Utilisation en ligne de commande :
+    python evaluation.py mon_premier_modele_anti_fraude.pkl --data creditcard.csv --threshold 0.3
+"""
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from scoring import DECISION_THRESHOLD, score_batch
+
+# Nombre d'évaluations gardées en mémoire (une par version de modèle / jeu de test)
+MAX_CACHED = 8
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Evaluation:
+    """Probabilités triées et cumuls des vrais / faux positifs d'un jeu de test"""
+
+    def __init__(self, y_true, probabilities):
+        y_true = np.asarray(y_true).astype(bool)
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        if len(y_true) != len(probabilities):
+            raise ValueError(f"{len(y_true)} étiquettes pour {len(probabilities)} probabilités")
+        order = np.argsort(probabilities, kind='stable')
+        self.probabilities = probabilities
+        self.y_true = y_true
+        # Scores croissants ; tp[k] / fp[k] = positifs / négatifs parmi les k scores les plus élevés
+        self.sorted_scores = probabilities[order]
+        descending = y_true[order][::-1]
+        self.tp = np.concatenate(([0], np.cumsum(descending)))
+        self.fp = np.concatenate(([0], np.cumsum(~descending)))
+        self.positives = int(self.tp[-1])
+        self.negatives = int(self.fp[-1])
+
+    @classmethod
+    def from_model(cls, model, X, y):
+        """Score `X` une fois (probabilités de fraude) et prépare les cumuls"""
+        probabilities, _, _ = score_batch(model, X)
+        return cls(y, probabilities)
+
+    def __len__(self):
+        return len(self.probabilities)
+
+    def _flagged(self, threshold):
+        """Nombre de transactions signalées (probabilité > seuil, comme scoring.score_batch)"""
+        return len(self.sorted_scores) - int(np.searchsorted(self.sorted_scores, threshold, side='right'))
+
+    def confusion(self, threshold=DECISION_THRESHOLD):
+        """Matrice de confusion [[VN, FP], [FN, VP]] (lignes : réel, colonnes : prédit)"""
+        k = self._flagged(threshold)
+        tp, fp = int(self.tp[k]), int(self.fp[k])
+        return np.array([[self.negatives - fp, fp], [self.positives - tp, tp]])
+
+    def at(self, threshold=DECISION_THRESHOLD):
+        """Métriques au seuil donné, en O(log n)"""
+        (tn, fp), (fn, tp) = self.confusion(threshold)
+        flagged = tp + fp
+        precision = tp / flagged if flagged else 0.0
+        recall = tp / self.positives if self.positives else 0.0
+        return {
+            'threshold': float(threshold),
+            'tp': int(tp), 'fp': int(fp), 'fn': int(fn), 'tn': int(tn),
+            'flagged': int(flagged),
+            'accuracy': (tp + tn) / len(self) if len(self) else 0.0,
+            'precision': precision,
+            'recall': recall,
+            'fpr': fp / self.negatives if self.negatives else 0.0,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        }
+
+    def _cuts(self):
+        """Nombre de transactions signalées à chaque seuil distinct (scores décroissants), et ces seuils"""
+        scores = self.sorted_scores[::-1]
+        # Dernière position de chaque groupe de scores égaux : les ex-aequo basculent ensemble
+        last = np.flatnonzero(np.diff(scores, append=-np.inf) != 0)
+        return last + 1, scores[last]
+
+    def roc(self):
+        """Courbe ROC : (taux de faux positifs, taux de vrais positifs, seuils), en partant de (0, 0).
+
+        Comme sklearn, le point d'un seuil signale les scores supérieurs ou égaux à ce seuil.
+        """
+        k, thresholds = self._cuts()
+        fpr = self.fp[k] / max(self.negatives, 1)
+        tpr = self.tp[k] / max(self.positives, 1)
+        return np.concatenate(([0.0], fpr)), np.concatenate(([0.0], tpr)), np.concatenate(([np.inf], thresholds))
+
+    def pr(self):
+        """Courbe précision-rappel : (précision, rappel, seuils), un point par seuil distinct"""
+        k, thresholds = self._cuts()
+        precision = self.tp[k] / k
+        recall = self.tp[k] / max(self.positives, 1)
+        return precision, recall, thresholds
+
+    def roc_auc(self):
+        fpr, tpr, _ = self.roc()
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    def average_precision(self):
+        """Précision moyenne : somme des précisions pondérées par les gains de rappel"""
+        precision, recall, _ = self.pr()
+        return float(np.sum(np.diff(recall, prepend=0.0) * precision))
+
+    def best_threshold(self, metric='f1'):
+        """Seuil distinct qui maximise `metric` ('f1', 'accuracy', 'precision', 'recall'), et ses métriques"""
+        k, thresholds = self._cuts()
+        tp, fp = self.tp[k], self.fp[k]
+        values = {
+            'accuracy': (tp + self.negatives - fp) / len(self),
+            'precision': tp / k,
+            'recall': tp / max(self.positives, 1),
+            'f1': 2 * tp / (k + self.positives),
+        }[metric]
+        # Seuil juste sous le meilleur score distinct : ce score et les suivants sont signalés
+        return self.at(np.nextafter(thresholds[int(np.argmax(values))], -np.inf))
+
+
+def get_evaluation(model_key, model, X, y):
+    """Évaluation du modèle `model_key` sur (X, y), calculée au premier appel seulement.
+
+    `model_key` doit changer dès que le modèle ou le jeu de test change (ex. artifact['key']).
+    """
+    with _cache_lock:
+        if model_key in _cache:
+            _cache.move_to_end(model_key)
+            return _cache[model_key]
+        result = Evaluation.from_model(model, X, y)
+        _cache[model_key] = result
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+        return result
+
+
+def main():
+    # Imports limités à la CLI
+    import joblib
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Métriques d'un modèle pour un ou plusieurs seuils")
+    parser.add_argument('model', help="Modèle picklé (joblib)")
+    parser.add_argument('--data', default='creditcard.csv')
+    parser.add_argument('--label', default='Class')
+    parser.add_argument('--threshold', type=float, action='append',
+                        help=f"Seuil à évaluer (répétable, défaut {DECISION_THRESHOLD})")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    evaluation = Evaluation.from_model(joblib.load(args.model), df.drop(args.label, axis=1), df[args.label])
+    print(f"{len(evaluation)} transactions, {evaluation.positives} fraudes ; "
+          f"AUC ROC {evaluation.roc_auc():.4f}, précision moyenne {evaluation.average_precision():.4f}")
+    best = evaluation.best_threshold()
+    for m in [evaluation.at(t) for t in args.threshold or [DECISION_THRESHOLD]] + [best]:
+        label = 'meilleur F1' if m is best else 'seuil'
+        print(f"{label} {m['threshold']:.4f} : précision {m['precision']:.4f}, rappel {m['recall']:.4f}, "
+              f"F1 {m['f1']:.4f}, VP {m['tp']}, FP {m['fp']}, FN {m['fn']}, VN {m['tn']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,510 @@
+"""Moteur d'inférence compilé pour les RandomForestClassifier de scikit-learn.
+
+Les arbres de la forêt sont aplatis dans quelques tableaux NumPy (feature,
+seuil, enfants gauche/droit entrelacés, probabilités par nœud) et parcourus de façon
+vectorisée sur toutes les lignes et tous les arbres à la fois. Les
+probabilités sont identiques à celles de `predict_proba` (mêmes conversions
+float32, mêmes comparaisons et même ordre d'accumulation).
+
+Format compact (`compact_forest`) : seuls les tableaux utiles à l'inférence,
+dans les plus petits types possibles (seuils float32 arrondis vers -inf,
+indices de features et d'enfants locaux à chaque arbre en int16, probabilités
+quantifiées sur 16 ou 8 bits). Les décisions des nœuds restent identiques ;
+seules les probabilités s'écartent, d'au plus un demi-pas de quantification.
+
+Utilisation en ligne de commande (vérification autonome ; vérification + benchmark, export compact) :
+    python forest_engine.py --self-check
+    python forest_engine.py mon_premier_modele_anti_fraude.pkl --data creditcard.csv
+    python forest_engine.py mon_premier_modele_anti_fraude.pkl --compact models/forest-compact
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAY_NAMES = ('feature', 'threshold', 'children', 'value', 'roots')
+# Nombre de lignes parcourues à la fois (borne la mémoire des tableaux (lignes, arbres))
+CHUNK_ROWS = 2048
+
+
+class CompiledForest:
+    """Forêt aplatie : s'utilise comme le modèle d'origine (predict, predict_proba)"""
+
+    LAYOUT = 'full'
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth,
+                 classes, n_features, feature_names=None, feature_importances=None):
+        self.feature = feature
+        self.threshold = threshold
+        # children[2 * i] = enfant gauche de i, children[2 * i + 1] = enfant droit
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.n_classes_ = len(self.classes_)
+        self.n_features_in_ = int(n_features)
+        if feature_names is not None:
+            self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        if feature_importances is not None:
+            self.feature_importances_ = np.asarray(feature_importances)
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def _as_matrix(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"{X.shape[1]} features reçues, {self.n_features_in_} attendues")
+        return np.ascontiguousarray(X)
+
+    def apply(self, X):
+        """Indice (global) de la feuille atteinte dans chaque arbre : (n, n_arbres)"""
+        X = self._as_matrix(X)
+        leaves = np.empty((len(X), self.n_estimators), dtype=np.int32)
+        for start in range(0, len(X), CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            leaves[start:start + len(chunk)] = self._traverse(chunk)
+        return leaves
+
+    def _traverse(self, X):
+        n = len(X)
+        flat = X.ravel()
+        base = (np.arange(n, dtype=np.int64) * X.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (n, self.n_estimators))
+        # Les feuilles bouclent sur elles-mêmes : pas besoin de test « est une feuille »
+        for _ in range(self.max_depth):
+            x = flat[base + self.feature[node]]
+            node = self.children[2 * node + ~(x <= self.threshold[node])]
+        return node
+
+    def predict_proba(self, X):
+        X = self._as_matrix(X)
+        proba = np.empty((len(X), self.n_classes_), dtype=np.float64)
+        for start in range(0, len(X), CHUNK_ROWS):
+            leaves = self._traverse(X[start:start + CHUNK_ROWS])
+            # (arbres, lignes, classes) : la somme sur l'axe 0 suit l'ordre des arbres, comme sklearn
+            proba[start:start + len(leaves)] = np.add.reduce(self.value[leaves.T], axis=0)
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def save(self, path):
+        """Écrit un répertoire de fichiers .npy (chargeables par memory-mapping).
+
+        Chaque export va dans un nouveau répertoire `<path>.v<n>` ; `path` est un lien
+        symbolique basculé atomiquement vers lui, comme le pointeur `.current` de
+        model_store. Un chargement voit toujours une version complète, et la version
+        précédente reste sur disque pour les serveurs qui la memory-mappent encore.
+        """
+        path = os.path.normpath(path)
+        tmp = f'{path}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            self._write(tmp)
+            version = _install_version(tmp, path)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        previous = os.path.join(os.path.dirname(path), os.readlink(path)) if os.path.islink(path) else None
+        if previous is None and os.path.isdir(path):
+            # Répertoire de l'ancien format : converti une fois, cet échange-là n'est pas atomique
+            shutil.rmtree(path)
+        link = f'{path}.link-{os.getpid()}'
+        os.symlink(os.path.basename(version), link)
+        os.replace(link, path)
+        _prune_versions(path, keep=(version, previous))
+        return path
+
+    def _write(self, path):
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'max_depth': self.max_depth,
+            'classes': self.classes_.tolist(),
+            'n_features': self.n_features_in_,
+            'feature_names': _names_or_none(self),
+            'feature_importances': _importances_or_none(self),
+            **self._meta(),
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def _meta(self):
+        return {'layout': self.LAYOUT}
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Recharge une forêt compilée ou compacte (selon meta.json) ; avec mmap_mode='r' les
+        pages sont partagées entre processus"""
+        while True:
+            # Version désignée par le lien au moment du chargement, même s'il bascule entre-temps
+            version = os.path.realpath(path)
+            try:
+                return cls._load_version(version, mmap_mode)
+            except FileNotFoundError:
+                # Version supprimée par un export concurrent pendant la lecture : on relit le lien
+                if os.path.realpath(path) == version:
+                    raise
+
+    @classmethod
+    def _load_version(cls, path, mmap_mode):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Format de forêt compilée non supporté : {meta.get('format_version')}")
+        klass = CompactForest if meta.get('layout') == CompactForest.LAYOUT else CompiledForest
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in ARRAY_NAMES}
+        extra = {'value_scale': meta['value_scale']} if klass is CompactForest else {}
+        return klass(max_depth=meta['max_depth'], classes=meta['classes'],
+                     n_features=meta['n_features'], feature_names=meta['feature_names'],
+                     feature_importances=meta['feature_importances'], **extra, **arrays)
+
+
+class CompactForest(CompiledForest):
+    """Forêt compacte : enfants indexés localement dans chaque arbre, probabilités quantifiées.
+
+    `value` contient des entiers ; la probabilité d'un nœud vaut value / value_scale.
+    """
+
+    LAYOUT = 'compact'
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, classes, n_features,
+                 value_scale, feature_names=None, feature_importances=None):
+        super().__init__(feature, threshold, children, value, roots, max_depth, classes, n_features,
+                         feature_names=feature_names, feature_importances=feature_importances)
+        self.value_scale = int(value_scale)
+
+    def _meta(self):
+        return {'layout': self.LAYOUT, 'value_scale': self.value_scale}
+
+    def _traverse(self, X):
+        n = len(X)
+        flat = X.ravel()
+        base = (np.arange(n, dtype=np.int64) * X.shape[1])[:, None]
+        roots = self.roots.astype(np.int64)
+        local = np.zeros((n, self.n_estimators), dtype=np.int64)
+        for _ in range(self.max_depth):
+            node = roots + local
+            x = flat[base + self.feature[node]]
+            local = self.children[2 * node + ~(x <= self.threshold[node])]
+        return roots + local
+
+    def predict_proba(self, X):
+        X = self._as_matrix(X)
+        proba = np.empty((len(X), self.n_classes_), dtype=np.float64)
+        for start in range(0, len(X), CHUNK_ROWS):
+            leaves = self._traverse(X[start:start + CHUNK_ROWS])
+            # Somme entière exacte sur les arbres, un seul arrondi à la fin
+            proba[start:start + len(leaves)] = self.value[leaves].sum(axis=1, dtype=np.int64)
+        proba /= self.n_estimators * self.value_scale
+        return proba
+
+    def expand(self):
+        """CompiledForest équivalente (indices globaux, float64), pour explain.py"""
+        own = np.repeat(self.roots.astype(np.int64), np.diff(np.append(self.roots, self.n_nodes)))
+        return CompiledForest(
+            feature=self.feature.astype(np.int32), threshold=self.threshold.astype(np.float64),
+            children=(self.children + np.repeat(own, 2)).astype(np.int32),
+            value=self.value / float(self.value_scale), roots=np.asarray(self.roots, dtype=np.int32),
+            max_depth=self.max_depth, classes=self.classes_, n_features=self.n_features_in_,
+            feature_names=_names_or_none(self), feature_importances=_importances_or_none(self))
+
+
+def _names_or_none(model):
+    names = getattr(model, 'feature_names_in_', None)
+    return [str(n) for n in names] if names is not None else None
+
+
+def _importances_or_none(model):
+    importances = getattr(model, 'feature_importances_', None)
+    return np.asarray(importances).tolist() if importances is not None else None
+
+
+def compile_forest(model):
+    """Aplatit un RandomForestClassifier entraîné en CompiledForest (une forêt déjà compilée est rendue telle quelle)"""
+    if isinstance(model, CompiledForest):
+        return model
+    estimators = model.estimators_
+    sizes = [est.tree_.node_count for est in estimators]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    n_nodes = int(sum(sizes))
+
+    feature = np.zeros(n_nodes, dtype=np.int32)
+    threshold = np.zeros(n_nodes, dtype=np.float64)
+    children = np.zeros(2 * n_nodes, dtype=np.int32)
+    value = np.zeros((n_nodes, len(model.classes_)), dtype=np.float64)
+    max_depth = 0
+
+    for est, offset, size in zip(estimators, offsets, sizes):
+        tree = est.tree_
+        nodes = slice(offset, offset + size)
+        own = np.arange(offset, offset + size, dtype=np.int32)
+        is_leaf = tree.children_left == -1
+
+        feature[nodes] = np.where(is_leaf, 0, tree.feature)
+        threshold[nodes] = np.where(is_leaf, 0.0, tree.threshold)
+        children[2 * offset:2 * (offset + size):2] = np.where(is_leaf, own, tree.children_left + offset)
+        children[2 * offset + 1:2 * (offset + size):2] = np.where(is_leaf, own, tree.children_right + offset)
+
+        # Même normalisation que DecisionTreeClassifier.predict_proba
+        counts = tree.value[:, 0, :]
+        normalizer = counts.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value[nodes] = counts / normalizer
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        feature=feature, threshold=threshold, children=children, value=value,
+        roots=offsets, max_depth=max_depth, classes=model.classes_,
+        n_features=model.n_features_in_, feature_names=_names_or_none(model),
+        feature_importances=getattr(model, 'feature_importances_', None),
+    )
+
+
+def _index_dtype(max_value):
+    return np.int16 if max_value <= np.iinfo(np.int16).max else np.int32
+
+
+def compact_forest(model, leaf_bits=16):
+    """Forêt compacte d'un RandomForestClassifier ou d'une CompiledForest.
+
+    Les seuils sont arrondis vers -inf en float32 : pour une entrée float32 x,
+    x <= seuil64 équivaut à x <= seuil32, donc chaque nœud prend la même
+    branche. Les probabilités sont quantifiées sur `leaf_bits` bits (8 ou 16).
+    """
+    if leaf_bits not in (8, 16):
+        raise ValueError("leaf_bits doit valoir 8 ou 16")
+    compiled = compile_forest(model)
+    n_nodes = compiled.n_nodes
+    roots = np.asarray(compiled.roots, dtype=np.int32)
+    sizes = np.diff(np.append(roots, n_nodes))
+
+    threshold = np.asarray(compiled.threshold, dtype=np.float32)
+    too_high = threshold.astype(np.float64) > compiled.threshold
+    threshold[too_high] = np.nextafter(threshold[too_high], np.float32(-np.inf))
+
+    own = np.repeat(roots.astype(np.int64), 2 * sizes)
+    children = (np.asarray(compiled.children, dtype=np.int64) - own).astype(_index_dtype(sizes.max() - 1))
+
+    value_scale = (1 << leaf_bits) - 1
+    value = np.rint(np.asarray(compiled.value) * value_scale).astype(np.uint16 if leaf_bits == 16 else np.uint8)
+
+    return CompactForest(
+        feature=np.asarray(compiled.feature).astype(_index_dtype(compiled.n_features_in_ - 1)),
+        threshold=threshold, children=children, value=value, roots=roots,
+        max_depth=compiled.max_depth, classes=compiled.classes_, n_features=compiled.n_features_in_,
+        value_scale=value_scale, feature_names=_names_or_none(compiled),
+        feature_importances=_importances_or_none(compiled),
+    )
+
+
+def compare_compact(model, compact, X, threshold=0.5):
+    """Écart de probabilité (max, moyen) et décisions différentes de la forêt compacte sur X"""
+    expected = model.predict_proba(X)[:, -1]
+    got = compact.predict_proba(np.asarray(X))[:, -1]
+    diff = np.abs(expected - got)
+    return {
+        'rows': len(X),
+        'max_abs_error': float(diff.max()),
+        'mean_abs_error': float(diff.mean()),
+        # Borne théorique : un demi-pas de quantification par nœud, moyenné sur les arbres
+        'error_bound': 0.5 / compact.value_scale,
+        'decision_changes': int(((expected > threshold) != (got > threshold)).sum()),
+    }
+
+
+def _versions(path):
+    """Répertoires `<path>.v<n>` existants : {n: chemin}"""
+    parent, prefix = os.path.dirname(path) or '.', os.path.basename(path) + '.v'
+    return {int(name[len(prefix):]): os.path.join(parent, name) for name in os.listdir(parent)
+            if name.startswith(prefix) and name[len(prefix):].isdigit()}
+
+
+def _install_version(tmp, path):
+    """Renomme `tmp` en `<path>.v<n>` (n libre suivant) ; retourne ce chemin"""
+    n = max(_versions(path), default=0) + 1
+    while True:
+        version = f'{path}.v{n}'
+        try:
+            os.rename(tmp, version)
+            return version
+        except OSError:
+            # Numéro pris entre-temps par un autre export
+            if not os.path.exists(version):
+                raise
+            n += 1
+
+
+def _prune_versions(path, keep):
+    """Supprime les versions de `path` autres que `keep`"""
+    keep = {os.path.normpath(p) for p in keep if p}
+    for version in _versions(path).values():
+        if os.path.normpath(version) not in keep:
+            shutil.rmtree(version, ignore_errors=True)
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def _load_seconds(load, repeats=5):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def compile_from_env(model):
+    """Remplace le modèle sklearn par sa version compilée si FRAUDE_COMPILED_FOREST=1"""
+    if os.environ.get('FRAUDE_COMPILED_FOREST', '0') not in ('1', 'true', 'yes'):
+        return model
+    return compile_forest(model)
+
+
+def check_equivalence(model, compiled, X, tolerance=0.0):
+    """Vérifie que la forêt compilée reproduit predict_proba (exactement, ou à `tolerance` près pour
+    une forêt compacte) et les décisions de sklearn ; retourne l'écart max"""
+    expected = model.predict_proba(X)
+    got = compiled.predict_proba(X)
+    max_diff = float(np.abs(expected - got).max())
+    if max_diff > tolerance:
+        raise AssertionError(f"Probabilités différentes de sklearn (écart max {max_diff:.3e})")
+    # Avec une tolérance, seules les lignes dont la décision est nette doivent être identiques
+    top = np.sort(expected, axis=1)
+    clear = top[:, -1] - top[:, -2] > 2 * tolerance if tolerance else slice(None)
+    if not np.array_equal(model.predict(X)[clear], compiled.predict(X)[clear]):
+        raise AssertionError("Décisions différentes de sklearn")
+    return max_diff
+
+
+def self_check(n_samples=5000, n_estimators=20, seed=42):
+    """Équivalence avec sklearn sans creditcard.csv ni modèle picklé : une forêt entraînée sur
+    synthetic_data, compilée (exacte, y compris rechargée du disque et ligne par ligne) et
+    compacte 16 / 8 bits (à un demi-pas de quantification près). Retourne {moteur: écart max}."""
+    import tempfile
+
+    from sklearn.ensemble import RandomForestClassifier
+
+    from synthetic_data import TRAINING_PARAMS, generate_fraud_frame
+
+    df = generate_fraud_frame(n_samples, seed=seed)
+    X = df[TRAINING_PARAMS['feature_columns']]
+    model = RandomForestClassifier(**{**TRAINING_PARAMS['model'], 'n_estimators': n_estimators})
+    model.fit(X, df['is_fraud'])
+
+    compiled = compile_forest(model)
+    results = {'compiled': check_equivalence(model, compiled, X)}
+    with tempfile.TemporaryDirectory() as tmp:
+        loaded = CompiledForest.load(compiled.save(os.path.join(tmp, 'forest')))
+        results['compiled (mmap)'] = check_equivalence(model, loaded, X)
+    results['compiled (1 ligne)'] = max(check_equivalence(model, compiled, X.iloc[i:i + 1])
+                                        for i in range(0, len(X), max(len(X) // 50, 1)))
+    for bits in (16, 8):
+        compact = compact_forest(compiled, leaf_bits=bits)
+        results[f'compact {bits} bits'] = check_equivalence(model, compact, X,
+                                                            tolerance=0.5 / compact.value_scale)
+    return results
+
+
+def _latency(fn, X, repeats):
+    timings = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        start = time.perf_counter()
+        fn(row)
+        timings.append(time.perf_counter() - start)
+    return np.percentile(np.array(timings) * 1000.0, [50, 95, 99])
+
+
+def benchmark(model, compiled, X, repeats=200, batch_size=10000):
+    """Latence unitaire (p50/p95/p99 en ms) et débit par lot des deux moteurs"""
+    results = {}
+    batch = X[:batch_size]
+    for name, engine, rows in (('sklearn', model, X), ('compiled', compiled, np.asarray(X))):
+        p50, p95, p99 = _latency(engine.predict_proba, rows, repeats)
+        start = time.perf_counter()
+        engine.predict_proba(batch if name == 'sklearn' else np.asarray(batch))
+        elapsed = time.perf_counter() - start
+        results[name] = {'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+                         'batch_rows_per_s': len(batch) / elapsed}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile une forêt aléatoire et la compare à sklearn")
+    parser.add_argument('model', nargs='?', default='mon_premier_modele_anti_fraude.pkl')
+    parser.add_argument('--self-check', action='store_true',
+                        help="Vérifie l'équivalence avec sklearn sur des données synthétiques, sans fichier")
+    parser.add_argument('--data', default='creditcard.csv', help="CSV de features pour le test")
+    parser.add_argument('--rows', type=int, default=20000, help="Lignes utilisées pour le test")
+    parser.add_argument('--out', help="Répertoire où enregistrer la forêt compilée")
+    parser.add_argument('--compact', help="Répertoire où exporter la forêt compacte (avec rapport)")
+    parser.add_argument('--leaf-bits', type=int, default=16, choices=(8, 16),
+                        help="Bits par probabilité de la forêt compacte")
+    args = parser.parse_args()
+
+    if args.self_check:
+        for engine, max_diff in self_check().items():
+            print(f"Équivalence avec sklearn ({engine}) : OK (écart max {max_diff:.1e})")
+        return
+
+    import joblib
+    import pandas as pd
+
+    model = joblib.load(args.model)
+    start = time.perf_counter()
+    compiled = compile_forest(model)
+    print(f"Compilation : {compiled.n_estimators} arbres, {compiled.n_nodes:,} nœuds "
+          f"en {time.perf_counter() - start:.3f}s")
+
+    X = pd.read_csv(args.data, nrows=args.rows)
+    columns = _names_or_none(model) or [c for c in X.columns if c != 'Class']
+    X = X[columns]
+
+    max_diff = check_equivalence(model, compiled, X)
+    print(f"Équivalence avec sklearn sur {len(X):,} lignes : OK (écart max {max_diff:.1e})")
+
+    for name, r in benchmark(model, compiled, X).items():
+        print(f"{name:>9} : p50 {r['p50_ms']:.3f} ms | p95 {r['p95_ms']:.3f} ms | "
+              f"p99 {r['p99_ms']:.3f} ms | lot {r['batch_rows_per_s']:,.0f} lignes/s")
+
+    if args.out:
+        compiled.save(args.out)
+        print(f"Forêt compilée enregistrée dans {args.out}")
+
+    if args.compact:
+        compact = compact_forest(compiled, leaf_bits=args.leaf_bits)
+        compact.save(args.compact)
+        report = compare_compact(model, CompactForest.load(args.compact), X)
+        pickle_size, compact_size = os.path.getsize(args.model), directory_size(args.compact)
+        pickle_load = _load_seconds(lambda: joblib.load(args.model))
+        compact_load = _load_seconds(lambda: CompiledForest.load(args.compact))
+        print(f"Forêt compacte ({args.leaf_bits} bits) enregistrée dans {args.compact}")
+        print(f"   taille : {compact_size / 1024:,.0f} Ko contre {pickle_size / 1024:,.0f} Ko "
+              f"pour le pickle (x{pickle_size / compact_size:.1f} plus petite)")
+        print(f"chargement : {compact_load * 1000:.2f} ms (mmap) contre {pickle_load * 1000:.1f} ms pour le pickle")
+        print(f"    écart : max {report['max_abs_error']:.2e}, moyen {report['mean_abs_error']:.2e} "
+              f"(borne {report['error_bound']:.2e}) ; {report['decision_changes']} décisions "
+              f"différentes sur {report['rows']:,} lignes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Mise à jour incrémentale du modèle : forêt à fenêtre glissante.
+
+Au lieu de réentraîner tous les arbres sur tout l'historique, chaque mise à
+jour entraîne quelques arbres sur le nouveau lot de transactions seulement,
+les ajoute à la forêt et retire les plus anciens au-delà de `max_trees`. Le
+coût d'une mise à jour est donc proportionnel au nouveau lot, et la forêt
+reflète les `max_trees / new_trees` derniers lots.
+
+Le modèle mis à jour est publié de façon atomique (model_store) ; les
+serveurs le chargent sans redémarrer (model_registry.py, ou POST /v1/reload).
+
+    python incremental.py transactions_du_jour.csv --new-trees 10 --max-trees 100 \\
+        --reload-url http://localhost:5000/v1/reload
+"""
+import argparse
+import copy
+import hashlib
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import joblib
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from csv_cache import fingerprint
+from forest_engine import compile_forest
+from model_store import CREDITCARD_MODEL, load_current, publish_artifact
+
+DEFAULT_BASE_MODEL = 'mon_premier_modele_anti_fraude.pkl'
+DEFAULT_NEW_TREES = 10
+DEFAULT_MAX_TREES = 100
+
+
+def fit_new_trees(model, X, y, n_trees, seed):
+    """n_trees arbres entraînés sur (X, y) seulement, avec les hyperparamètres de `model`"""
+    params = model.get_params()
+    params.update(n_estimators=n_trees, warm_start=False, random_state=seed, n_jobs=-1, oob_score=False)
+    fresh = RandomForestClassifier(**params).fit(X, y)
+    if list(fresh.classes_) != list(model.classes_):
+        raise ValueError(f"Le lot doit contenir toutes les classes {list(model.classes_)}, "
+                         f"reçu {list(fresh.classes_)}")
+    return fresh.estimators_
+
+
+def slide_forest(model, X, y, n_new_trees=DEFAULT_NEW_TREES, max_trees=DEFAULT_MAX_TREES, seed=0):
+    """Nouvelle forêt = arbres les plus récents de `model` + n_new_trees arbres entraînés sur le lot.
+
+    `model` n'est pas modifié (il peut être en train de servir des requêtes).
+    Retourne (forêt mise à jour, nombre d'arbres retirés).
+    """
+    if n_new_trees > max_trees:
+        raise ValueError("n_new_trees ne peut pas dépasser max_trees")
+    new_trees = fit_new_trees(model, X, y, n_new_trees, seed)
+    retired = max(0, len(model.estimators_) + len(new_trees) - max_trees)
+    updated = copy.copy(model)
+    updated.estimators_ = list(model.estimators_[retired:]) + list(new_trees)
+    updated.n_estimators = len(updated.estimators_)
+    return updated, retired
+
+
+def _batch_seed(batch_key):
+    return int(hashlib.sha1(batch_key.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def update_artifact(batch_path, name=CREDITCARD_MODEL, base_model=DEFAULT_BASE_MODEL,
+                    n_new_trees=DEFAULT_NEW_TREES, max_trees=DEFAULT_MAX_TREES,
+                    label_column='Class', models_dir=None):
+    """Met à jour la version publiée de `name` avec le lot `batch_path` puis publie le résultat.
+
+    Sans version publiée, part du modèle picklé `base_model`. Retourne un dict
+    (chemin de l'artefact, arbres ajoutés/retirés, lignes, durée d'entraînement).
+    """
+    artifact = load_current(name, models_dir, mmap_mode=None)
+    if artifact is not None:
+        model, base_key, window = artifact['model'], artifact['key'], artifact.get('window')
+    else:
+        model, base_key, window = joblib.load(base_model), fingerprint(base_model), None
+    if window is None:
+        window = [{'batch': 'initial', 'trees': len(model.estimators_)}]
+
+    batch = pd.read_csv(batch_path)
+    feature_columns = list(getattr(model, 'feature_names_in_', batch.columns.drop(label_column)))
+    batch_key = fingerprint(batch_path)
+
+    started = time.perf_counter()
+    updated, retired = slide_forest(model, batch[feature_columns], batch[label_column],
+                                    n_new_trees, max_trees, seed=_batch_seed(batch_key))
+    updated.set_params(n_jobs=None)
+    fit_seconds = time.perf_counter() - started
+
+    # Fenêtre : lots encore représentés dans la forêt, du plus ancien au plus récent
+    window = [dict(entry) for entry in window]
+    to_retire = retired
+    while to_retire and window:
+        taken = min(to_retire, window[0]['trees'])
+        window[0]['trees'] -= taken
+        to_retire -= taken
+        if window[0]['trees'] == 0:
+            window.pop(0)
+    window.append({'batch': batch_key, 'trees': n_new_trees, 'rows': len(batch),
+                   'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds')})
+
+    params = {'base': base_key, 'batch': batch_key, 'n_new_trees': n_new_trees, 'max_trees': max_trees}
+    payload = {
+        'model': updated,
+        'forest': compile_forest(updated),
+        'feature_columns': feature_columns,
+        'window': window,
+    }
+    path = publish_artifact(name, params, payload, models_dir)
+    return {'path': path, 'added': n_new_trees, 'retired': retired, 'trees': updated.n_estimators,
+            'rows': len(batch), 'fit_seconds': fit_seconds}
+
+
+def notify_reload(url, timeout=30):
+    """Demande à un serveur de charger la nouvelle version (POST sur son endpoint de reload)"""
+    request = urllib.request.Request(url, data=b'', method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read().decode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mise à jour incrémentale (fenêtre glissante d'arbres)")
+    parser.add_argument('batch', help="CSV des nouvelles transactions étiquetées")
+    parser.add_argument('--name', default=CREDITCARD_MODEL, help="Nom de l'artefact publié")
+    parser.add_argument('--base-model', default=DEFAULT_BASE_MODEL,
+                        help="Modèle de départ si aucune version n'est publiée")
+    parser.add_argument('--new-trees', type=int, default=DEFAULT_NEW_TREES)
+    parser.add_argument('--max-trees', type=int, default=DEFAULT_MAX_TREES)
+    parser.add_argument('--reload-url', help="Endpoint à appeler ensuite, ex. http://localhost:5000/v1/reload")
+    args = parser.parse_args()
+
+    result = update_artifact(args.batch, args.name, args.base_model, args.new_trees, args.max_trees)
+    print(f"{result['added']} arbres ajoutés sur {result['rows']:,} lignes en "
+          f"{result['fit_seconds']:.1f}s, {result['retired']} retirés ({result['trees']} au total) : "
+          f"{result['path']}")
+    if args.reload_url:
+        print(notify_reload(args.reload_url))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Métriques des requêtes (format texte Prometheus) et profilage par échantillonnage.
+
+- Un histogramme de durée par route et par étape (parse, features, inference,
+  render), plus la durée totale de chaque requête, les réponses par code HTTP
+  et les exceptions par type.
+- `instrument(app)` branche les hooks Flask et ajoute la route `GET /metrics`.
+- Profilage optionnel : pour une fraction FRAUDE_PROFILE_RATE des requêtes, un
+  thread échantillonne la pile du thread de la requête toutes les
+  FRAUDE_PROFILE_INTERVAL_MS et ajoute des piles repliées (une ligne
+  `route;f1;f2;f3 n`) à FRAUDE_PROFILE_PATH, lisibles par flamegraph.pl ou
+  speedscope. Désactivé (taux 0, défaut), il ne coûte qu'une comparaison.
+
+    with REQUEST_METRICS.stage('inference'):
+        score = score_transaction(model, features)
+
+    FRAUDE_PROFILE_RATE=0.05 python app_corrige.py
+    flamegraph.pl profiles/requests.folded > flamegraph.svg
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Bornes supérieures des histogrammes, en secondes
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PROFILE_PATH = os.environ.get('FRAUDE_PROFILE_PATH', os.path.join('profiles', 'requests.folded'))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+
+class Histogram:
+    """Histogramme cumulatif par combinaison de labels (buckets fixes)"""
+
+    def __init__(self, name, help, labelnames, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(s[0]), s[1], s[2]) for labels, s in self._series.items()}
+        for labels, (counts, count, total) in sorted(series.items()):
+            base = _labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+class CounterMetric:
+    """Compteur par combinaison de labels"""
+
+    def __init__(self, name, help, labelnames):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def value(self, labels):
+        with self._lock:
+            return self._values[labels]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f'{self.name}{{{_labels(self.labelnames, labels)}}} {value}')
+        return lines
+
+
+class _ProfileSession:
+    """Échantillonne la pile d'un thread jusqu'à stop()"""
+
+    def __init__(self, label, thread_id, interval):
+        self.label = label
+        self.stacks = Counter()
+        self._thread_id = thread_id
+        self._interval = interval
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._sampler.start()
+
+    def _run(self):
+        while not self._done.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self._sampler.join()
+        return self.stacks
+
+
+class SamplingProfiler:
+    """Profileur par échantillonnage d'une fraction `rate` des requêtes (piles repliées)"""
+
+    def __init__(self, rate=0.0, interval_ms=1.0, path=PROFILE_PATH):
+        self.rate = rate
+        self.interval = interval_ms / 1000.0
+        self.path = path
+        self.profiles = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(rate=float(os.environ.get('FRAUDE_PROFILE_RATE', '0')),
+                   interval_ms=float(os.environ.get('FRAUDE_PROFILE_INTERVAL_MS', '1')))
+
+    def start(self, label):
+        """Session de profilage pour le thread courant, ou None si la requête n'est pas tirée"""
+        if self.rate <= 0 or random.random() >= self.rate:
+            return None
+        return _ProfileSession(label, threading.get_ident(), self.interval)
+
+    def stop(self, session):
+        stacks = session.stop()
+        if not stacks:
+            return
+        label = session.label.replace(';', '_').replace(' ', '_')
+        lines = ''.join(f'{label};{stack} {count}\n' for stack, count in stacks.items())
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(lines)
+            self.profiles += 1
+
+
+class RequestMetrics:
+    """Durées par route et par étape, réponses et exceptions des requêtes"""
+
+    def __init__(self, profiler=None):
+        self.requests = Histogram('fraude_request_duration_seconds',
+                                  'Durée totale des requêtes', ('route',))
+        self.stages = Histogram('fraude_stage_duration_seconds',
+                                'Durée de chaque étape du traitement', ('route', 'stage'))
+        self.responses = CounterMetric('fraude_requests_total', 'Réponses par code HTTP',
+                                       ('route', 'status'))
+        self.errors = CounterMetric('fraude_errors_total', 'Exceptions levées pendant les requêtes',
+                                    ('route', 'exception'))
+        self.rejected = CounterMetric('fraude_rejected_total',
+                                      'Requêtes refusées avant traitement (saturation, délai, taille)',
+                                      ('reason',))
+        self.profiler = profiler or SamplingProfiler()
+        self._local = threading.local()
+
+    def begin(self, route):
+        self._local.route = route
+        self._local.started = time.perf_counter()
+        self._local.profile = self.profiler.start(route)
+
+    def end(self, status):
+        route = getattr(self._local, 'route', None)
+        if route is None:
+            return
+        self.requests.observe((route,), time.perf_counter() - self._local.started)
+        self.responses.inc((route, str(status)))
+        if self._local.profile is not None:
+            self.profiler.stop(self._local.profile)
+        self._local.route = self._local.profile = None
+
+    @contextmanager
+    def stage(self, name):
+        """Chronomètre une étape de la requête en cours"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            route = getattr(self._local, 'route', None) or 'none'
+            self.stages.observe((route, name), time.perf_counter() - started)
+
+    def count_error(self, error, route=None):
+        route = route or getattr(self._local, 'route', None) or 'none'
+        self.errors.inc((route, type(error).__name__))
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.stages, self.responses, self.errors, self.rejected):
+            lines.extend(metric.render())
+        lines.extend(['# HELP fraude_profiles_total Requêtes profilées',
+                      '# TYPE fraude_profiles_total counter',
+                      f'fraude_profiles_total {self.profiler.profiles}'])
+        return '\n'.join(lines) + '\n'
+
+
+REQUEST_METRICS = RequestMetrics(SamplingProfiler.from_env())
+
+
+def instrument(app, metrics=REQUEST_METRICS):
+    """Mesure chaque requête de l'application Flask `app` et ajoute GET /metrics"""
+    # Flask n'est nécessaire que pour le serveur, pas pour les métriques elles-mêmes
+    from flask import Response, request
+
+    def route_label():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    @app.before_request
+    def _begin():
+        metrics.begin(route_label())
+
+    @app.after_request
+    def _record_status(response):
+        metrics._local.status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _end(error):
+        if error is not None:
+            metrics.count_error(error)
+        status = 500 if error is not None else getattr(metrics._local, 'status', None) or 200
+        metrics._local.status = None
+        metrics.end(status)
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
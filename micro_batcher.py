@@ -0,0 +1,158 @@
+"""Regroupement (micro-batching) des prédictions unitaires concurrentes"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+# Bornes (ms) de l'histogramme du temps d'attente ajouté par le regroupement
+WAIT_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 25.0)
+
+
+class MicroBatcher:
+    """Met en file les appels predict_proba d'une seule ligne et les score par lots.
+
+    Un thread unique attend au plus `max_wait_ms` après la première requête
+    (ou `max_batch_size` lignes), empile les lignes, appelle une seule fois
+    predict_proba puis rend à chaque appelant sa propre ligne de résultat.
+    L'objet s'utilise comme le modèle : predict, predict_proba, classes_...
+    """
+
+    def __init__(self, model, max_wait_ms=2.0, max_batch_size=64):
+        self.model = model
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {}
+        self._wait_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._requests = 0
+        self._batches = 0
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        # Délègue classes_, feature_names_in_, etc. au modèle sous-jacent
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def submit(self, row):
+        """Met une ligne en file et retourne un Future du vecteur de probabilités"""
+        future = Future()
+        # Une ligne invalide ne fait échouer que son propre Future, pas le lot ni le thread
+        try:
+            values = np.asarray(row, dtype=np.float64).reshape(-1)
+        except (TypeError, ValueError) as e:
+            future.set_exception(e)
+            return future
+        n_features = getattr(self.model, 'n_features_in_', None)
+        if n_features is not None and len(values) != n_features:
+            future.set_exception(ValueError(f"{len(values)} features reçues, {n_features} attendues"))
+            return future
+        self._queue.put((values, time.perf_counter(), future))
+        return future
+
+    def predict_proba(self, X):
+        if len(X) != 1:
+            return self.model.predict_proba(X)
+        return self.submit(np.asarray(X)).result()[None, :]
+
+    def predict(self, X):
+        proba = self.predict_proba(X)
+        return self.model.classes_[np.argmax(proba, axis=1)]
+
+    def close(self):
+        """Arrête le thread de regroupement après avoir vidé la file"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = item[1] + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._score(batch)
+            if stop:
+                return
+
+    def _score(self, batch):
+        started = time.perf_counter()
+        # Un seul modèle par lot : colonnes et scoring viennent de la même version,
+        # même si le registre bascule pendant le scoring (ActiveModel.pin)
+        model = self.model.pin() if hasattr(self.model, 'pin') else self.model
+        columns = getattr(model, 'feature_names_in_', None)
+        try:
+            X = np.vstack([values for values, _, _ in batch])
+            if columns is not None:
+                X = pd.DataFrame(X, columns=list(columns), copy=False)
+            proba = model.predict_proba(X)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._record(batch, started)
+        for i, (_, _, future) in enumerate(batch):
+            future.set_result(proba[i])
+
+    def _record(self, batch, started):
+        waits = [started - enqueued for _, enqueued, _ in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            for wait in waits:
+                self._wait_counts[np.searchsorted(WAIT_BUCKETS_MS, wait * 1000.0)] += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+
+    def stats(self):
+        """Profondeur de file, histogramme des tailles de lot et attente ajoutée"""
+        with self._stats_lock:
+            labels = [f"<={b}ms" for b in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_wait_ms': self.max_wait * 1000.0,
+                'max_batch_size': self.max_batch_size,
+                'requests': self._requests,
+                'batches': self._batches,
+                'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'wait_ms_histogram': dict(zip(labels, self._wait_counts)),
+                'mean_wait_ms': 1000.0 * self._wait_total / self._requests if self._requests else 0.0,
+                'max_wait_observed_ms': 1000.0 * self._wait_max,
+            }
+
+
+def from_env(model):
+    """Enveloppe le modèle dans un MicroBatcher si FRAUDE_MICRO_BATCH=1.
+
+    FRAUDE_MICRO_BATCH_WAIT_MS (défaut 2) et FRAUDE_MICRO_BATCH_SIZE (défaut 64)
+    règlent la fenêtre de regroupement.
+    """
+    if os.environ.get('FRAUDE_MICRO_BATCH', '0') not in ('1', 'true', 'yes'):
+        return model
+    return MicroBatcher(
+        model,
+        max_wait_ms=float(os.environ.get('FRAUDE_MICRO_BATCH_WAIT_MS', '2')),
+        max_batch_size=int(os.environ.get('FRAUDE_MICRO_BATCH_SIZE', '64')),
+    )
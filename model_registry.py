@@ -0,0 +1,298 @@
+"""Registre des modèles servis : plusieurs modèles nommés, rechargement à chaud, shadow scoring.
+
+Chaque nom publié dans model_store (`models/<nom>.current`) devient un modèle
+du registre. Un thread de surveillance détecte les nouvelles versions, les
+charge en arrière-plan puis échange le pointeur de façon atomique : aucune
+requête n'est interrompue et aucun redémarrage n'est nécessaire.
+
+`registry.model` est le modèle actif, utilisable partout où l'on passe un
+modèle (score_batch, MicroBatcher...) : chaque appel résout la version
+courante et mesure sa latence. Un modèle candidat peut être scoré en shadow
+sur une fraction des requêtes, hors du chemin de la réponse ; ses écarts
+avec le modèle actif sont comptés.
+
+Configuration (from_env) :
+    FRAUDE_ACTIVE_MODEL    nom du modèle actif (défaut creditcard_model)
+    FRAUDE_SHADOW_MODEL    nom du modèle candidat (optionnel)
+    FRAUDE_SHADOW_RATE     fraction des requêtes scorées en shadow (défaut 0.1)
+    FRAUDE_WATCH_INTERVAL  secondes entre deux vérifications (défaut 5, 0 = désactivé)
+"""
+import glob
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model_store import CREDITCARD_MODEL, MODELS_DIR, ModelHandle, current_artifact_path
+from scoring import DECISION_THRESHOLD, fraud_index
+
+logger = logging.getLogger(__name__)
+
+# Nombre de latences gardées par modèle pour les percentiles
+LATENCY_WINDOW = 2048
+# Lots shadow en attente au-delà desquels les nouveaux sont abandonnés
+MAX_SHADOW_BACKLOG = 32
+
+
+class ModelEntry:
+    """Un modèle nommé du registre : sa version courante, son temps de chargement et ses latences"""
+
+    def __init__(self, name, fallback_path=None, models_dir=None, prepare=None):
+        self.name = name
+        started = time.perf_counter()
+        self.handle = ModelHandle(name, fallback_path, models_dir, prepare=prepare)
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._calls = 0
+        self._rows = 0
+
+    @property
+    def model(self):
+        return self.handle.model
+
+    def reload(self):
+        started = time.perf_counter()
+        if not self.handle.reload():
+            return False
+        self.load_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+        return True
+
+    def predict_proba(self, X, model=None):
+        """Probabilités du modèle courant (ou de `model`, version déjà lue de cette entrée)"""
+        model = self.handle.model if model is None else model
+        started = time.perf_counter()
+        proba = model.predict_proba(X)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append(elapsed * 1000.0)
+            self._calls += 1
+            self._rows += len(proba)
+        return proba
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            calls, rows = self._calls, self._rows
+        percentiles = (dict(zip(('p50_ms', 'p95_ms', 'p99_ms'),
+                                np.percentile(latencies, [50, 95, 99]).tolist()))
+                       if len(latencies) else {'p50_ms': None, 'p95_ms': None, 'p99_ms': None})
+        return {
+            'version': self.handle.version(),
+            'loaded_at': self.loaded_at,
+            'load_seconds': self.load_seconds,
+            'swaps': self.handle.swaps,
+            'calls': calls,
+            'rows': rows,
+            **percentiles,
+        }
+
+
+class ActiveModel:
+    """Modèle actif du registre : chaque appel passe par la version active à cet instant.
+
+    `pin()` fige cette version pour une suite d'appels (ex. colonnes puis scoring d'un lot).
+    """
+
+    def __init__(self, registry, entry=None):
+        self._registry = registry
+        self._entry = entry
+        self._model = entry.model if entry is not None else None
+
+    def pin(self):
+        return ActiveModel(self._registry, self._registry.entry())
+
+    def predict_proba(self, X):
+        return self._registry.predict_proba(X, self._entry, self._model)
+
+    def predict(self, X):
+        model = self.pin() if self._entry is None else self
+        return model.classes_[np.argmax(model.predict_proba(X), axis=1)]
+
+    def __getattr__(self, name):
+        # classes_, feature_names_in_, feature_importances_... du modèle actif (ou figé)
+        model = self._model if self._entry is not None else self._registry.entry().model
+        return getattr(model, name)
+
+
+class ModelRegistry:
+    """Modèles nommés, pointeur actif, modèle shadow et surveillance du répertoire des artefacts"""
+
+    def __init__(self, active=CREDITCARD_MODEL, fallbacks=None, models_dir=None, prepare=None,
+                 shadow=None, shadow_rate=0.1):
+        self.models_dir = models_dir or MODELS_DIR
+        self.fallbacks = dict(fallbacks or {})
+        self.prepare = prepare
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.active = active
+        self.register(active)
+        self.shadow = None
+        self.shadow_rate = 0.0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        self._shadow_pending = 0
+        self._shadow_stats = {'batches': 0, 'rows': 0, 'dropped': 0, 'errors': 0,
+                              'disagreements': 0, 'abs_diff_sum': 0.0, 'max_abs_diff': 0.0}
+        if shadow:
+            self.set_shadow(shadow, shadow_rate)
+        self.model = ActiveModel(self)
+        self._watcher = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, fallbacks=None, prepare=None):
+        registry = cls(active=os.environ.get('FRAUDE_ACTIVE_MODEL', CREDITCARD_MODEL),
+                       fallbacks=fallbacks, prepare=prepare,
+                       shadow=os.environ.get('FRAUDE_SHADOW_MODEL') or None,
+                       shadow_rate=float(os.environ.get('FRAUDE_SHADOW_RATE', '0.1')))
+        interval = float(os.environ.get('FRAUDE_WATCH_INTERVAL', '5'))
+        if interval > 0:
+            registry.start_watcher(interval)
+        return registry
+
+    def register(self, name):
+        """Charge le modèle `name` (version publiée, sinon son modèle de secours) s'il est nouveau"""
+        with self._lock:
+            if name in self._entries:
+                return self._entries[name]
+        fallback = self.fallbacks.get(name)
+        if fallback is None and current_artifact_path(name, self.models_dir) is None:
+            raise KeyError(f"Aucune version publiée de '{name}' dans {self.models_dir}")
+        entry = ModelEntry(name, fallback, self.models_dir, prepare=self.prepare)
+        with self._lock:
+            return self._entries.setdefault(name, entry)
+
+    def entry(self, name=None):
+        return self._entries[name or self.active]
+
+    def names(self):
+        with self._lock:
+            return list(self._entries)
+
+    def set_active(self, name):
+        """Bascule le pointeur actif (le modèle est chargé avant la bascule)"""
+        self.register(name)
+        self.active = name
+
+    def set_shadow(self, name, rate=0.1):
+        """Score `rate` des requêtes aussi avec `name` (None désactive le shadow)"""
+        if name is not None:
+            self.register(name)
+        self.shadow, self.shadow_rate = name, float(rate) if name else 0.0
+
+    def predict_proba(self, X, entry=None, model=None):
+        """Probabilités du modèle actif (ou de `entry` / `model` figés par ActiveModel.pin)"""
+        entry = entry or self.entry()
+        model = entry.model if model is None else model
+        proba = entry.predict_proba(X, model)
+        shadow = self.shadow
+        if shadow and shadow != entry.name and random.random() < self.shadow_rate:
+            self._submit_shadow(shadow, X, proba, fraud_index(model))
+        return proba
+
+    def _submit_shadow(self, name, X, proba, column):
+        with self._lock:
+            if self._shadow_pending >= MAX_SHADOW_BACKLOG:
+                self._shadow_stats['dropped'] += 1
+                return
+            self._shadow_pending += 1
+        self._shadow_executor.submit(self._run_shadow, name, X, proba[:, column])
+
+    def _run_shadow(self, name, X, active_fraud):
+        try:
+            entry = self.entry(name)
+            shadow_fraud = entry.predict_proba(X)[:, fraud_index(entry.model)]
+        except Exception:
+            with self._lock:
+                self._shadow_pending -= 1
+                self._shadow_stats['errors'] += 1
+            return
+        diff = np.abs(shadow_fraud - active_fraud)
+        disagreements = int(((shadow_fraud > DECISION_THRESHOLD) != (active_fraud > DECISION_THRESHOLD)).sum())
+        with self._lock:
+            self._shadow_pending -= 1
+            stats = self._shadow_stats
+            stats['batches'] += 1
+            stats['rows'] += len(diff)
+            stats['disagreements'] += disagreements
+            stats['abs_diff_sum'] += float(diff.sum())
+            stats['max_abs_diff'] = max(stats['max_abs_diff'], float(diff.max(initial=0.0)))
+
+    def reload(self):
+        """Recharge les modèles dont une nouvelle version a été publiée ; retourne leurs noms.
+
+        Un artefact illisible n'empêche pas de recharger les autres : il est
+        journalisé et retenté au prochain appel.
+        """
+        reloaded = []
+        for name in self.names():
+            try:
+                if self.entry(name).reload():
+                    reloaded.append(name)
+            except Exception:
+                logger.exception("Rechargement du modèle '%s' impossible", name)
+        return reloaded
+
+    def scan(self):
+        """Enregistre les nouveaux noms publiés et recharge les versions modifiées.
+
+        Un pointeur `.current` orphelin ou à moitié publié est journalisé et ignoré.
+        """
+        for pointer in glob.glob(os.path.join(self.models_dir, '*.current')):
+            name = os.path.basename(pointer)[:-len('.current')]
+            try:
+                self.register(name)
+            except Exception:
+                logger.exception("Modèle '%s' ignoré : pointeur %s inutilisable", name, pointer)
+        return self.reload()
+
+    def start_watcher(self, interval=5.0):
+        """Surveille le répertoire des artefacts dans un thread d'arrière-plan"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.scan()
+                except Exception:
+                    # Le thread survit : nouvel essai au prochain tour
+                    logger.exception("Surveillance de %s : échec du scan", self.models_dir)
+
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+        self._shadow_executor.shutdown(wait=True)
+
+    def active_version(self):
+        return self.entry().handle.version()
+
+    def stats(self):
+        """Modèles (version, chargement, latences), pointeur actif et comparaison shadow"""
+        with self._lock:
+            shadow = dict(self._shadow_stats)
+            pending = self._shadow_pending
+        rows = shadow.pop('rows')
+        abs_diff_sum = shadow.pop('abs_diff_sum')
+        shadow.update({
+            'model': self.shadow,
+            'rate': self.shadow_rate,
+            'rows': rows,
+            'pending': pending,
+            'mean_abs_diff': abs_diff_sum / rows if rows else None,
+            'disagreement_rate': shadow['disagreements'] / rows if rows else None,
+        })
+        return {
+            'active': self.active,
+            'models': {name: self.entry(name).stats() for name in self.names()},
+            'shadow': shadow,
+        }
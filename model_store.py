@@ -0,0 +1,149 @@
+"""Artefacts de modèle versionnés sur disque.
+
+Chaque artefact est identifié par un hash de ses paramètres d'entraînement
+(hyperparamètres, graine et taille du générateur de données, version de
+scikit-learn) : il n'est reconstruit que lorsque cette clé change. Les
+artefacts sont relus avec joblib en `mmap_mode='r'` pour que plusieurs
+processus partagent les mêmes pages au lieu d'en garder chacun une copie.
+
+Un artefact peut aussi être publié comme version courante d'un nom
+(`publish_artifact`) : un petit fichier `<nom>.current` désigne l'artefact
+que les applications chargent (`load_current`).
+"""
+import hashlib
+import json
+import os
+import threading
+
+import joblib
+import sklearn
+
+from forest_engine import CompiledForest
+
+MODELS_DIR = os.environ.get('FRAUDE_MODELS_DIR', 'models')
+# Modèle creditcard.csv publié par training.py
+CREDITCARD_MODEL = 'creditcard_model'
+
+
+def artifact_key(params):
+    """Hash stable des paramètres qui déterminent le modèle"""
+    blob = json.dumps({'params': params, 'sklearn': sklearn.__version__},
+                      sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()[:16]
+
+
+def artifact_path(name, key, models_dir=None):
+    return os.path.join(models_dir or MODELS_DIR, f'{name}-{key}.joblib')
+
+
+def save_artifact(payload, path):
+    """Écrit l'artefact de façon atomique (fichier temporaire puis renommage)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    try:
+        joblib.dump(payload, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def load_artifact(path, mmap_mode='r'):
+    """Relit un artefact ; les tableaux NumPy sont memory-mappés (lecture seule)"""
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def load_or_build(name, params, build, models_dir=None, mmap_mode='r'):
+    """Charge l'artefact correspondant à `params`, ou l'entraîne avec `build(params)` puis l'enregistre.
+
+    `build` reçoit les paramètres de la clé et retourne un dict ; la clé et les paramètres y sont ajoutés.
+    """
+    key = artifact_key(params)
+    path = artifact_path(name, key, models_dir)
+    if not os.path.exists(path):
+        payload = build(params)
+        payload.update({'key': key, 'params': params})
+        save_artifact(payload, path)
+    return load_artifact(path, mmap_mode=mmap_mode)
+
+
+def current_pointer(name, models_dir=None):
+    return os.path.join(models_dir or MODELS_DIR, f'{name}.current')
+
+
+def publish_artifact(name, params, payload, models_dir=None):
+    """Enregistre l'artefact de `params` et en fait la version courante de `name`"""
+    key = artifact_key(params)
+    path = artifact_path(name, key, models_dir)
+    payload.update({'key': key, 'params': params})
+    save_artifact(payload, path)
+    pointer = current_pointer(name, models_dir)
+    tmp_pointer = f'{pointer}.tmp-{os.getpid()}'
+    with open(tmp_pointer, 'w') as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp_pointer, pointer)
+    return path
+
+
+def current_artifact_path(name, models_dir=None):
+    """Chemin de la version courante de `name`, ou None si rien n'a été publié"""
+    try:
+        with open(current_pointer(name, models_dir)) as f:
+            filename = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(models_dir or MODELS_DIR, filename)
+    return path if os.path.exists(path) else None
+
+
+def load_current(name, models_dir=None, mmap_mode='r'):
+    """Artefact courant de `name` (dict), ou None si aucun n'a été publié"""
+    path = current_artifact_path(name, models_dir)
+    return load_artifact(path, mmap_mode=mmap_mode) if path else None
+
+
+def load_current_model(name, fallback_path, models_dir=None):
+    """Modèle de l'artefact courant de `name`, sinon `fallback_path` (modèle picklé, ou
+    répertoire d'une forêt compilée / compacte, memory-mappée)"""
+    artifact = load_current(name, models_dir)
+    if artifact is not None:
+        return artifact['model']
+    if os.path.isdir(fallback_path):
+        return CompiledForest.load(fallback_path)
+    return joblib.load(fallback_path)
+
+
+class ModelHandle:
+    """Modèle courant d'un serveur, remplaçable à chaud par la dernière version publiée.
+
+    Les requêtes lisent `handle.model` une fois et gardent cette référence :
+    celles en cours finissent avec l'ancien modèle, les suivantes utilisent le
+    nouveau. Le nouveau modèle est entièrement chargé avant l'échange.
+    """
+
+    def __init__(self, name, fallback_path, models_dir=None, prepare=None):
+        self.name = name
+        self.fallback_path = fallback_path
+        self.models_dir = models_dir
+        self.prepare = prepare or (lambda model: model)
+        self._lock = threading.Lock()
+        self.path = current_artifact_path(name, models_dir)
+        self.model = self.prepare(load_current_model(name, fallback_path, models_dir))
+        self.swaps = 0
+
+    def reload(self):
+        """Charge la version publiée si elle a changé ; retourne True si le modèle a été échangé"""
+        with self._lock:
+            path = current_artifact_path(self.name, self.models_dir)
+            if path is None or path == self.path:
+                return False
+            model = self.prepare(load_artifact(path)['model'])
+            # Affectation atomique : aucune requête ne voit un modèle partiellement chargé
+            self.model = model
+            self.path = path
+            self.swaps += 1
+            return True
+
+    def version(self):
+        return os.path.basename(self.path) if self.path else os.path.basename(self.fallback_path)
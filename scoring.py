@@ -0,0 +1,60 @@
+"""Logique de décision commune à app.py, app_corrige.py et streamlit_app.py.
+
+La forêt n'est parcourue qu'une fois (predict_proba) : la décision et le
+niveau de risque sont déduits de la probabilité de fraude. Les seuils se
+règlent par variables d'environnement plutôt que dans chaque interface.
+"""
+import os
+
+import numpy as np
+
+# Probabilité au-delà de laquelle la transaction est classée fraude (équivaut à predict)
+DECISION_THRESHOLD = float(os.environ.get('FRAUDE_DECISION_THRESHOLD', '0.5'))
+# Seuils des niveaux de risque (transaction suspecte / risque élevé)
+SUSPECT_THRESHOLD = float(os.environ.get('FRAUDE_SUSPECT_THRESHOLD', '0.3'))
+HIGH_RISK_THRESHOLD = float(os.environ.get('FRAUDE_HIGH_RISK_THRESHOLD', '0.7'))
+
+RISK_LOW = 'faible'
+RISK_MEDIUM = 'moyen'
+RISK_HIGH = 'eleve'
+
+
+def thresholds():
+    """Seuils actifs (pour affichage ou réponse JSON)"""
+    return {
+        'decision': DECISION_THRESHOLD,
+        'suspect': SUSPECT_THRESHOLD,
+        'high_risk': HIGH_RISK_THRESHOLD,
+    }
+
+
+def fraud_index(model):
+    """Colonne de predict_proba correspondant à la classe fraude (1)"""
+    return list(model.classes_).index(1)
+
+
+def risk_bands(probabilities, decisions=None):
+    """Niveau de risque de chaque probabilité ; une décision fraude est toujours « élevé »"""
+    probabilities = np.asarray(probabilities)
+    high = probabilities > HIGH_RISK_THRESHOLD
+    if decisions is not None:
+        high |= np.asarray(decisions).astype(bool)
+    return np.where(high, RISK_HIGH, np.where(probabilities > SUSPECT_THRESHOLD, RISK_MEDIUM, RISK_LOW))
+
+
+def score_batch(model, X, threshold=None):
+    """Score un lot : (probabilités de fraude, décisions 0/1, niveaux de risque)"""
+    threshold = DECISION_THRESHOLD if threshold is None else threshold
+    probabilities = model.predict_proba(X)[:, fraud_index(model)]
+    decisions = (probabilities > threshold).astype(int)
+    return probabilities, decisions, risk_bands(probabilities, decisions)
+
+
+def score_transaction(model, X, threshold=None):
+    """Score une seule transaction et retourne probabilité, décision et niveau de risque"""
+    probabilities, decisions, bands = score_batch(model, X, threshold)
+    return {
+        'probability': float(probabilities[0]),
+        'decision': int(decisions[0]),
+        'risk_band': str(bands[0]),
+    }
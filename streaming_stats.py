@@ -0,0 +1,232 @@
+"""Statistiques incrémentales et fusionnables pour un flux de transactions.
+
+L'état (comptages par classe, moyennes et co-moments pour la covariance,
+histogrammes à bornes fixes, activité horaire) se met à jour par micro-lots
+(algorithme de Welford / Chan et al.) et se fusionne entre shards. Les
+tableaux de bord lisent l'état courant en temps constant, sans relire les
+transactions, et l'état se sauvegarde sur disque.
+
+    python streaming_stats.py update stats.npz nouvelles_transactions.csv
+    python streaming_stats.py merge total.npz shard-0.npz shard-1.npz
+    python streaming_stats.py show stats.npz
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+
+
+def hours_of(times, time_unit):
+    """Heure de la journée (0-23) : `time_unit` 's' (secondes écoulées) ou 'h' (heure décimale)"""
+    times = np.asarray(times, dtype=np.float64)
+    if time_unit == 's':
+        return (times // 3600).astype(np.int64) % 24
+    return times.astype(np.int64) % 24
+
+
+class RunningStats:
+    """État fusionnable : n, moyennes, co-moments, comptages, histogrammes et heures"""
+
+    def __init__(self, columns, label_column, amount_column, time_column,
+                 amount_edges, time_unit='s'):
+        self.columns = list(columns)
+        self.label_column = label_column
+        self.amount_column = amount_column
+        self.time_column = time_column
+        self.time_unit = time_unit
+        self.amount_edges = np.asarray(amount_edges, dtype=np.float64)
+        n_columns, n_bins = len(self.columns), len(self.amount_edges) - 1
+        self.n = 0
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros((n_columns, n_columns))
+        self.class_counts = {}
+        self.amount_hist = {}
+        self.amount_hist_all = np.zeros(n_bins, dtype=np.int64)
+        self.hourly_counts = np.zeros(24, dtype=np.int64)
+
+    @classmethod
+    def for_frame(cls, df, label_column, amount_column, time_column, time_unit='s', bins=50,
+                  amount_max=None):
+        """État vide adapté aux colonnes de df, avec bins de montant fixés sur [0, amount_max]"""
+        if amount_max is None:
+            amount_max = float(df[amount_column].max()) if len(df) else 1.0
+        columns = df.select_dtypes('number').columns
+        edges = np.linspace(0.0, amount_max, bins + 1)
+        return cls(columns, label_column, amount_column, time_column, edges, time_unit)
+
+    def _same_layout(self, other):
+        return (self.columns == other.columns and self.label_column == other.label_column
+                and self.time_unit == other.time_unit
+                and np.array_equal(self.amount_edges, other.amount_edges))
+
+    def _merge_moments(self, n, mean, m2):
+        # Combinaison de deux (n, moyenne, co-moments) : Chan et al.
+        if n == 0:
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + m2 + np.outer(delta, delta) * (self.n * n / total)
+        self.n = total
+
+    def _amount_bins(self, amounts):
+        # Les montants hors bornes vont dans le premier / dernier bin
+        n_bins = len(self.amount_edges) - 1
+        return np.clip(np.searchsorted(self.amount_edges, amounts, side='right') - 1, 0, n_bins - 1)
+
+    def update(self, batch):
+        """Ajoute un micro-lot (DataFrame) à l'état"""
+        if len(batch) == 0:
+            return self
+        X = batch[self.columns].to_numpy(dtype=np.float64)
+        mean = X.mean(axis=0)
+        centered = X - mean
+        self._merge_moments(len(X), mean, centered.T @ centered)
+
+        labels = batch[self.label_column].to_numpy()
+        bins = self._amount_bins(batch[self.amount_column].to_numpy(dtype=np.float64))
+        n_bins = len(self.amount_edges) - 1
+        self.amount_hist_all += np.bincount(bins, minlength=n_bins)
+        for c in np.unique(labels):
+            c_key = int(c)
+            mask = labels == c
+            self.class_counts[c_key] = self.class_counts.get(c_key, 0) + int(mask.sum())
+            hist = self.amount_hist.setdefault(c_key, np.zeros(n_bins, dtype=np.int64))
+            hist += np.bincount(bins[mask], minlength=n_bins)
+
+        hours = hours_of(batch[self.time_column].to_numpy(), self.time_unit)
+        self.hourly_counts += np.bincount(hours, minlength=24)
+        return self
+
+    def merge(self, other):
+        """Fusionne l'état d'un autre shard (mêmes colonnes et mêmes bornes)"""
+        if not self._same_layout(other):
+            raise ValueError("États incompatibles : colonnes ou bornes d'histogramme différentes")
+        self._merge_moments(other.n, other.mean, other.m2)
+        for c, count in other.class_counts.items():
+            self.class_counts[c] = self.class_counts.get(c, 0) + count
+        for c, hist in other.amount_hist.items():
+            self.amount_hist[c] = self.amount_hist.get(c, 0) + hist
+        self.amount_hist_all += other.amount_hist_all
+        self.hourly_counts += other.hourly_counts
+        return self
+
+    def covariance(self):
+        return self.m2 / max(self.n - 1, 1)
+
+    def correlation(self):
+        """Matrice de corrélation de Pearson (comme df.corr())"""
+        cov = self.covariance()
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = cov / np.outer(std, std)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def summary(self):
+        """Agrégats au format de aggregates.compute_aggregates (O(colonnes² + bins))"""
+        fraud_count = self.class_counts.get(1, 0)
+        hist = {'all': self.amount_hist_all.copy()}
+        hist.update({c: h.copy() for c, h in self.amount_hist.items()})
+        return {
+            'n_rows': self.n,
+            'class_counts': dict(self.class_counts),
+            'fraud_count': fraud_count,
+            'fraud_rate': fraud_count / self.n if self.n else 0.0,
+            'amount_edges': self.amount_edges.copy(),
+            'amount_hist': hist,
+            'hourly_counts': self.hourly_counts.copy(),
+            'corr': self.correlation(),
+            'mean': pd.Series(self.mean, index=self.columns),
+            'std': pd.Series(np.sqrt(np.diag(self.covariance())), index=self.columns),
+        }
+
+    def save(self, path):
+        """Point de contrôle sur disque (npz, écriture atomique)"""
+        classes = sorted(self.amount_hist)
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'columns': self.columns,
+            'label_column': self.label_column,
+            'amount_column': self.amount_column,
+            'time_column': self.time_column,
+            'time_unit': self.time_unit,
+            'class_counts': {str(c): n for c, n in self.class_counts.items()},
+        }
+        tmp = f'{path}.tmp-{os.getpid()}.npz'
+        np.savez(tmp, meta=np.array(json.dumps(meta)), n=np.array(self.n), mean=self.mean,
+                 m2=self.m2, amount_edges=self.amount_edges, amount_hist_all=self.amount_hist_all,
+                 hist_classes=np.array(classes, dtype=np.int64),
+                 hist_counts=np.array([self.amount_hist[c] for c in classes], dtype=np.int64).reshape(
+                     len(classes), len(self.amount_edges) - 1),
+                 hourly_counts=self.hourly_counts)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"Format d'état non supporté : {meta.get('format_version')}")
+            stats = cls(meta['columns'], meta['label_column'], meta['amount_column'],
+                        meta['time_column'], data['amount_edges'], meta['time_unit'])
+            stats.n = int(data['n'])
+            stats.mean = data['mean']
+            stats.m2 = data['m2']
+            stats.amount_hist_all = data['amount_hist_all']
+            stats.amount_hist = {int(c): h for c, h in zip(data['hist_classes'], data['hist_counts'])}
+            stats.hourly_counts = data['hourly_counts']
+            stats.class_counts = {int(c): n for c, n in meta['class_counts'].items()}
+        return stats
+
+
+def update_from_csv(stats_path, csv_path, chunk_size=100000, label_column='Class',
+                    amount_column='Amount', time_column='Time', time_unit='s', bins=50):
+    """Met à jour (ou crée) l'état de stats_path avec un CSV lu par micro-lots"""
+    stats = RunningStats.load(stats_path) if os.path.exists(stats_path) else None
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        if stats is None:
+            stats = RunningStats.for_frame(chunk, label_column, amount_column, time_column,
+                                           time_unit=time_unit, bins=bins)
+        stats.update(chunk)
+    if stats is not None:
+        stats.save(stats_path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistiques incrémentales des transactions")
+    sub = parser.add_subparsers(dest='command', required=True)
+    update = sub.add_parser('update', help="Ajoute un CSV à un état (créé si absent)")
+    update.add_argument('state')
+    update.add_argument('csv')
+    update.add_argument('--chunk-size', type=int, default=100000)
+    update.add_argument('--bins', type=int, default=50)
+    merge = sub.add_parser('merge', help="Fusionne plusieurs états de shards")
+    merge.add_argument('output')
+    merge.add_argument('states', nargs='+')
+    show = sub.add_parser('show', help="Affiche le résumé d'un état")
+    show.add_argument('state')
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        stats = update_from_csv(args.state, args.csv, chunk_size=args.chunk_size, bins=args.bins)
+    elif args.command == 'merge':
+        stats = RunningStats.load(args.states[0])
+        for path in args.states[1:]:
+            stats.merge(RunningStats.load(path))
+        stats.save(args.output)
+    else:
+        stats = RunningStats.load(args.state)
+
+    summary = stats.summary()
+    print(f"{summary['n_rows']:,} transactions, {summary['fraud_count']:,} fraudes "
+          f"({summary['fraud_rate']:.4%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,26 @@
+import os
+
 import streamlit as st
 import pandas as pd
-import joblib
 import matplotlib.pyplot as plt
 import numpy as np
 
+from micro_batcher import MicroBatcher, from_env
+from forest_engine import compile_from_env
+from model_store import CREDITCARD_MODEL
+from model_registry import ModelRegistry
+from scoring import score_transaction
+from csv_cache import fingerprint, load_frame
+from aggregates import get_aggregates, load_stats_summary
+import chart_cache
+from explain import ForestExplainer
+from sensitivity import describe, plot_curve, plot_heatmap, standard_sweeps, sweep
+
+# État incrémental des statistiques (python streaming_stats.py update ...), optionnel
+STATS_PATH = os.environ.get('FRAUDE_STATS_PATH')
+# Modèle picklé, ou répertoire d'une forêt compacte (python forest_engine.py --compact)
+MODEL_PATH = os.environ.get('FRAUDE_MODEL_PATH', 'mon_premier_modele_anti_fraude.pkl')
+
 # Configuration de la page
 st.set_page_config(
     page_title="Dashboard Anti-Fraude",
@@ -17,17 +34,41 @@ st.title("📊 Dashboard Anti-Fraude")
 st.markdown("**Système de détection avec 99.96% de précision**")
 
 # Charger le modèle et les données
-@st.cache_data
+@st.cache_resource
 def load_data():
-    return pd.read_csv('creditcard.csv')
+    # Cache binaire memory-mappé, partagé entre sessions (cache_data recopierait le DataFrame)
+    return load_frame('creditcard.csv')
+
+@st.cache_resource
+def load_registry():
+    # Registre partagé entre les sessions : le dernier modèle publié (training.py,
+    # incremental.py) a priorité sur le modèle picklé et remplace le modèle actif
+    # à chaud, sans redémarrer Streamlit (FRAUDE_WATCH_INTERVAL).
+    return ModelRegistry.from_env(fallbacks={CREDITCARD_MODEL: MODEL_PATH}, prepare=compile_from_env)
 
 @st.cache_resource
 def load_model():
-    return joblib.load('mon_premier_modele_anti_fraude.pkl')
+    # Modèle actif du registre, regroupé en micro-lots si FRAUDE_MICRO_BATCH=1
+    return from_env(load_registry().model)
+
+@st.cache_resource(max_entries=2)
+def load_explainer(version):
+    # Contributions par feature au score (parcours de la forêt compilée), une fois par version
+    return ForestExplainer(load_registry().entry().model)
+
+def show_explanation(features, score):
+    st.markdown("**🔎 Pourquoi ce score ?**")
+    explanation = explainer.explain_row(features)
+    st.caption(f"Score moyen de la forêt : {explainer.bias:.4%}, "
+               f"plus les contributions ci-dessous = {score['probability']:.4%}")
+    st.dataframe(explanation.head(8).map('{:+.4%}'.format).rename('Contribution'),
+                 width='stretch')
 
 try:
     df = load_data()
+    registry = load_registry()
     model = load_model()
+    explainer = load_explainer(registry.active_version())
     st.success("✅ Données et modèle chargés avec succès!")
 except Exception as e:
     st.error(f"❌ Erreur lors du chargement: {e}")
@@ -44,16 +85,25 @@ page = st.sidebar.radio(
 if page == "🏠 Vue d'ensemble":
     st.header("📈 Vue d'ensemble du Dataset")
     
+    # État incrémental du flux s'il existe (streaming_stats), sinon agrégats
+    # calculés une fois par version du dataset ; partagés entre sessions
+    if STATS_PATH and os.path.exists(STATS_PATH):
+        data_key = fingerprint(STATS_PATH)
+        agg = load_stats_summary(STATS_PATH)
+    else:
+        data_key = fingerprint('creditcard.csv')
+        agg = get_aggregates(data_key, df, 'Class', 'Amount', 'Time', time_unit='s', bins=50)
+    
     # Métriques principales
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Total Transactions", f"{len(df):,}")
+        st.metric("Total Transactions", f"{agg['n_rows']:,}")
     with col2:
-        fraudes = df['Class'].sum()
+        fraudes = agg['fraud_count']
         st.metric("Transactions Frauduleuses", fraudes)
     with col3:
-        taux_fraude = (fraudes / len(df)) * 100
+        taux_fraude = agg['fraud_rate'] * 100
         st.metric("Taux de Fraude", f"{taux_fraude:.4f}%")
     with col4:
         st.metric("Précision du Modèle", "99.96%")
@@ -63,32 +113,44 @@ if page == "🏠 Vue d'ensemble":
     
     with col1:
         st.subheader("Distribution des Transactions")
-        fig, ax = plt.subplots(figsize=(10, 6))
-        counts = df['Class'].value_counts()
-        colors = ['#2ecc71', '#e74c3c']
-        bars = ax.bar(['Normales', 'Fraudes'], counts, color=colors, alpha=0.8)
-        ax.set_ylabel('Nombre de Transactions')
-        ax.set_title('Transactions Normales vs Frauduleuses')
         
-        # Ajouter les nombres sur les barres
-        for bar, count in zip(bars, counts):
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 1000,
-                    f'{count:,}', ha='center', va='bottom')
+        def draw_classes():
+            fig, ax = plt.subplots(figsize=(10, 6))
+            counts = [agg['class_counts'].get(0, 0), agg['class_counts'].get(1, 0)]
+            colors = ['#2ecc71', '#e74c3c']
+            bars = ax.bar(['Normales', 'Fraudes'], counts, color=colors, alpha=0.8)
+            ax.set_ylabel('Nombre de Transactions')
+            ax.set_title('Transactions Normales vs Frauduleuses')
+            
+            # Ajouter les nombres sur les barres
+            for bar, count in zip(bars, counts):
+                height = bar.get_height()
+                ax.text(bar.get_x() + bar.get_width()/2., height + 1000,
+                        f'{count:,}', ha='center', va='bottom')
+            return fig
         
-        st.pyplot(fig)
+        # Rendu une fois par version des données (chart_cache)
+        st.image(chart_cache.render('class_counts', data_key, {}, draw_classes), width='stretch')
     
     with col2:
         st.subheader("Distribution des Montants")
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.hist(df[df['Class'] == 0]['Amount'].values, bins=50, alpha=0.7, label='Normales', color='green')
-        ax.hist(df[df['Class'] == 1]['Amount'].values, bins=50, alpha=0.7, label='Fraudes', color='red')
-        ax.set_xlabel('Montant ($)')
-        ax.set_ylabel('Fréquence')
-        ax.set_title('Distribution des Montants par Type')
-        ax.legend()
-        ax.set_yscale('log')
-        st.pyplot(fig)
+        
+        def draw_amounts():
+            fig, ax = plt.subplots(figsize=(10, 6))
+            edges = agg['amount_edges']
+            # Classe absente du dataset : histogramme vide de la bonne taille
+            empty = np.zeros(len(edges) - 1)
+            ax.hist(edges[:-1], bins=edges, weights=agg['amount_hist'].get(0, empty), alpha=0.7, label='Normales', color='green')
+            ax.hist(edges[:-1], bins=edges, weights=agg['amount_hist'].get(1, empty), alpha=0.7, label='Fraudes', color='red')
+            ax.set_xlabel('Montant ($)')
+            ax.set_ylabel('Fréquence')
+            ax.set_title('Distribution des Montants par Type')
+            ax.legend()
+            ax.set_yscale('log')
+            return fig
+        
+        st.image(chart_cache.render('amount_hist', data_key, {'bins': len(agg['amount_edges']) - 1},
+                                    draw_amounts), width='stretch')
 
 # PAGE 2: TESTEUR DE TRANSACTIONS
 elif page == "🧪 Testeur de Transactions":
@@ -117,19 +179,20 @@ elif page == "🧪 Testeur de Transactions":
                 template['Amount'] = montant
                 template = template[df.drop('Class', axis=1).columns]
                 
-                # Prédiction
-                prediction = model.predict(template)[0]
-                probability = model.predict_proba(template)[0]
+                # Prédiction (un seul passage dans la forêt)
+                score = score_transaction(model, template)
                 
                 with col2:
                     st.subheader("Résultats")
-                    if prediction == 1:
+                    if score['decision'] == 1:
                         st.error(f"🚨 **FRAUDE DÉTECTÉE**")
                     else:
                         st.success(f"✅ **TRANSACTION NORMALE**")
                     
-                    st.metric("Probabilité de fraude", f"{probability[1]:.4%}")
-                    st.metric("Probabilité de normal", f"{probability[0]:.4%}")
+                    st.metric("Probabilité de fraude", f"{score['probability']:.4%}")
+                    st.metric("Probabilité de normal", f"{1 - score['probability']:.4%}")
+                    st.metric("Niveau de risque", score['risk_band'].capitalize())
+                    show_explanation(template, score)
         
         elif test_type == "🎲 Transaction aléatoire":
             if st.button("🎯 Tester une transaction réelle", type="primary"):
@@ -138,9 +201,9 @@ elif page == "🧪 Testeur de Transactions":
                 features = transaction_reelle.drop('Class', axis=1)
                 vraie_valeur = transaction_reelle['Class'].values[0]
                 
-                # Prédiction
-                prediction = model.predict(features)[0]
-                probability = model.predict_proba(features)[0]
+                # Prédiction (un seul passage dans la forêt)
+                score = score_transaction(model, features)
+                prediction = score['decision']
                 
                 with col2:
                     st.subheader("Résultats du Test Réel")
@@ -159,7 +222,23 @@ elif page == "🧪 Testeur de Transactions":
                         st.error("❌ **PRÉDICTION INCORRECTE**")
                     
                     st.metric("Montant", f"${features['Amount'].values[0]:.2f}")
-                    st.metric("Probabilité de fraude", f"{probability[1]:.4%}")
+                    st.metric("Probabilité de fraude", f"{score['probability']:.4%}")
+                    show_explanation(features, score)
+    
+    if test_type == "💰 Montant personnalisé":
+        # Variantes de la transaction de test scorées en un seul appel au modèle actif
+        st.subheader("📉 Analyse de sensibilité")
+        base = df.iloc[0].drop('Class')
+        base['Amount'] = montant
+        sweeps = standard_sweeps(base, 'Amount', 'Time', ['V1', 'V2', 'V3'],
+                                 (0.0, max(2 * montant, 1000.0)), hour_seconds=3600)
+        choice = st.selectbox("Faire varier", list(sweeps))
+        result = sweep(registry.model, base, sweeps[choice])
+        draw = plot_curve if len(result['axes']) == 1 else plot_heatmap
+        params = (choice, tuple(round(float(v), 6) for v in base), [axis.key() for axis in result['axes']])
+        st.image(chart_cache.render('sensitivity', registry.active_version(), params, lambda: draw(result)),
+                 width='stretch')
+        st.caption(describe(result))
 
 # PAGE 3: ANALYSE DU MODÈLE
 elif page == "🤖 Analyse du Modèle":
@@ -174,21 +253,25 @@ elif page == "🤖 Analyse du Modèle":
     }).sort_values('Importance', ascending=False)
     
     # Graphique d'importance
-    fig, ax = plt.subplots(figsize=(12, 8))
-    top_features = feature_importance.head(15)
-    colors = plt.cm.viridis(np.linspace(0, 1, len(top_features)))
-    bars = ax.barh(top_features['Feature'], top_features['Importance'], color=colors)
-    ax.set_xlabel('Importance')
-    ax.set_title('Importance des Features pour la Détection de Fraude')
-    ax.invert_yaxis()
-    
-    # Ajouter les valeurs sur les barres
-    for bar, importance in zip(bars, top_features['Importance']):
-        width = bar.get_width()
-        ax.text(width + 0.001, bar.get_y() + bar.get_height()/2, 
-                f'{importance:.4f}', ha='left', va='center')
+    def draw_importances():
+        fig, ax = plt.subplots(figsize=(12, 8))
+        top_features = feature_importance.head(15)
+        colors = plt.cm.viridis(np.linspace(0, 1, len(top_features)))
+        bars = ax.barh(top_features['Feature'], top_features['Importance'], color=colors)
+        ax.set_xlabel('Importance')
+        ax.set_title('Importance des Features pour la Détection de Fraude')
+        ax.invert_yaxis()
+        
+        # Ajouter les valeurs sur les barres
+        for bar, importance in zip(bars, top_features['Importance']):
+            width = bar.get_width()
+            ax.text(width + 0.001, bar.get_y() + bar.get_height()/2, 
+                    f'{importance:.4f}', ha='left', va='center')
+        return fig
     
-    st.pyplot(fig)
+    # Rendu une fois par version du modèle (chart_cache)
+    st.image(chart_cache.render('feature_importance', fingerprint(registry.entry().handle.path or MODEL_PATH), {'top': 15},
+                                draw_importances), width='stretch')
     
     # Tableau détaillé
     st.subheader("Tableau détaillé des Features")
@@ -205,5 +288,16 @@ st.sidebar.info(
 st.sidebar.markdown("### 📊 Informations Système")
 st.sidebar.write(f"**Transactions chargées:** {len(df):,}")
 st.sidebar.write(f"**Features disponibles:** {len(df.columns) - 1}")
+if isinstance(model, MicroBatcher):
+    batch_stats = model.stats()
+    st.sidebar.write(f"**Micro-lots:** {batch_stats['batches']:,} "
+                     f"(taille moy. {batch_stats['mean_batch_size']:.1f}, "
+                     f"attente moy. {batch_stats['mean_wait_ms']:.2f} ms)")
+active = registry.stats()['models'][registry.active]
+latency = f", p95 {active['p95_ms']:.1f} ms" if active['p95_ms'] is not None else ""
+st.sidebar.write(f"**Modèle:** {active['version']} (chargé en {active['load_seconds']:.2f}s{latency})")
+charts = chart_cache.stats()
+st.sidebar.write(f"**Cache graphiques:** {charts['hit_rate']:.0%} de hits "
+                 f"({charts['hits']}/{charts['hits'] + charts['misses']}, {charts['entries']} images)")
 
 # 
@@ -0,0 +1,173 @@
+"""Générateur vectorisé de transactions synthétiques (données de test et de charge).
+
+Les lignes sont produites par blocs de BLOCK_ROWS avec `numpy.random.Generator`,
+en float32. Chaque bloc a sa propre graine dérivée de (seed, numéro du bloc) :
+le résultat ne dépend que de `seed` et `n_samples`, que l'on génère tout en
+mémoire, bloc par bloc ou en shards sur disque.
+
+    python synthetic_data.py --rows 20000000 --out donnees/ --shard-rows 1000000
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# À incrémenter dès que les données produites changent (invalide les modèles versionnés)
+GENERATOR_VERSION = 2
+BLOCK_ROWS = 1 << 16
+TARGET_FRAUD_RATE = 0.01
+N_V_FEATURES = 10
+FEATURE_COLUMNS = ['amount', 'time'] + [f'v{i}' for i in range(1, N_V_FEATURES + 1)]
+COLUMNS = FEATURE_COLUMNS + ['is_fraud']
+
+# Modèle de démonstration d'app.py (et du benchmark) : toute modification change la version de l'artefact
+TRAINING_PARAMS = {
+    'n_samples': 5000,
+    'seed': 42,
+    'generator_version': GENERATOR_VERSION,
+    'test_size': 0.3,
+    'feature_columns': FEATURE_COLUMNS,
+    'model': {
+        'n_estimators': 100,
+        'max_depth': 10,
+        'random_state': 42,
+        'class_weight': 'balanced',
+    },
+}
+
+
+def _block_sizes(n_samples):
+    full, rest = divmod(n_samples, BLOCK_ROWS)
+    return [BLOCK_ROWS] * full + ([rest] if rest else [])
+
+
+def generate_block(n, seed=42, block=0):
+    """Un bloc de n transactions : dict {colonne: tableau}"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block,)))
+
+    # Caractéristiques des transactions
+    amount = np.exp(rng.standard_normal(n, dtype=np.float32) * np.float32(1.5) + np.float32(4))
+    hour = rng.random(n, dtype=np.float32) * np.float32(24)
+    v = rng.standard_normal((N_V_FEATURES, n), dtype=np.float32)
+
+    # Motifs de fraude réalistes
+    fraud_probability = (
+        (amount > 1000) * 0.3 +
+        (hour < 6) * 0.2 +  # Nuit = risque plus élevé
+        (hour > 22) * 0.2 +
+        (np.abs(v[:3]) > 2).sum(axis=0) * 0.1
+    )
+    is_fraud = rng.random(n) < np.clip(fraud_probability, 0, 0.5)
+
+    # Ajuster pour avoir au moins ~1% de fraudes, sans boucle ni indexation pandas
+    deficit = int(TARGET_FRAUD_RATE * n) - int(is_fraud.sum())
+    if deficit > 0:
+        is_fraud[rng.choice(np.flatnonzero(~is_fraud), deficit, replace=False)] = True
+
+    columns = {'amount': amount, 'time': hour}
+    columns.update({f'v{i + 1}': v[i] for i in range(N_V_FEATURES)})
+    columns['is_fraud'] = is_fraud.astype(np.int8)
+    return columns
+
+
+def iter_fraud_blocks(n_samples, seed=42):
+    """Blocs successifs (dict de colonnes) couvrant n_samples lignes"""
+    for block, n in enumerate(_block_sizes(n_samples)):
+        yield generate_block(n, seed=seed, block=block)
+
+
+def generate_fraud_frame(n_samples=10000, seed=42):
+    """DataFrame complet de n_samples transactions (colonnes préallouées, remplies bloc par bloc)"""
+    data = {c: np.empty(n_samples, dtype=np.int8 if c == 'is_fraud' else np.float32) for c in COLUMNS}
+    start = 0
+    for columns in iter_fraud_blocks(n_samples, seed):
+        n = len(columns['amount'])
+        for name, values in columns.items():
+            data[name][start:start + n] = values
+        start += n
+    return pd.DataFrame(data, copy=False)
+
+
+def fit_fraud_model(params=TRAINING_PARAMS):
+    """Entraîne le modèle de détection de fraude sur les données synthétiques (70/30 stratifié)"""
+    # scikit-learn n'est nécessaire que pour l'entraînement, pas pour générer les données
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+
+    from forest_engine import compile_forest
+
+    df = generate_fraud_frame(params['n_samples'], seed=params['seed'])
+    feature_columns = params['feature_columns']
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[feature_columns], df['is_fraud'], test_size=params['test_size'],
+        random_state=params['seed'], stratify=df['is_fraud'])
+
+    # Entraînement sur tous les cœurs, puis prédictions unitaires sans pool de threads
+    model = RandomForestClassifier(**params['model'], n_jobs=-1)
+    model.fit(X_train, y_train)
+    model.set_params(n_jobs=None)
+
+    # La forêt compilée (tableaux NumPy) est partagée entre processus via memory-mapping,
+    # contrairement aux arbres sklearn qui sont recopiés au chargement
+    return {
+        'model': model,
+        'forest': compile_forest(model),
+        'X_test': X_test,
+        'y_test': y_test,
+        'feature_columns': feature_columns,
+    }
+
+
+def write_fraud_shards(out_dir, n_samples, seed=42, shard_rows=1_000_000, fmt='csv'):
+    """Écrit n_samples transactions en shards `part-00000.<fmt>` ; retourne la liste des fichiers.
+
+    shard_rows est arrondi à un multiple de BLOCK_ROWS : les shards ne changent
+    donc pas les données produites, seulement leur découpage.
+    """
+    if fmt not in ('csv', 'parquet'):
+        raise ValueError(f"Format de shard inconnu : {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    blocks_per_shard = max(1, round(shard_rows / BLOCK_ROWS))
+    paths = []
+    pending = []
+
+    def flush():
+        shard = pd.concat([pd.DataFrame(b, copy=False) for b in pending], ignore_index=True)
+        path = os.path.join(out_dir, f'part-{len(paths):05d}.{fmt}')
+        if fmt == 'csv':
+            shard.to_csv(path, index=False)
+        else:
+            shard.to_parquet(path, index=False)
+        paths.append(path)
+        pending.clear()
+
+    for columns in iter_fraud_blocks(n_samples, seed):
+        pending.append(columns)
+        if len(pending) == blocks_per_shard:
+            flush()
+    if pending:
+        flush()
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère des transactions synthétiques en shards")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='donnees_synthetiques')
+    parser.add_argument('--shard-rows', type=int, default=1_000_000)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = write_fraud_shards(args.out, args.rows, seed=args.seed,
+                               shard_rows=args.shard_rows, fmt=args.format)
+    elapsed = time.perf_counter() - start
+    print(f"{args.rows:,} lignes en {len(paths)} shards dans {args.out} "
+          f"({elapsed:.1f}s, {args.rows / elapsed:,.0f} lignes/s)")
+
+
+if __name__ == '__main__':
+    main()
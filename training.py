@@ -0,0 +1,245 @@
+"""Entraînement sur creditcard.csv avec recherche d'hyperparamètres parallèle et reprise.
+
+- Les données sont lues depuis le cache binaire de csv_cache (matrice float32
+  memory-mappée) : chaque worker les ouvre lui-même, rien n'est picklé.
+- Les folds de validation croisée stratifiée sont calculés une seule fois et
+  enregistrés (`folds.npz`) ; tous les essais et toutes les reprises les réutilisent.
+- Chaque essai (un jeu d'hyperparamètres, évalué sur tous les folds) tourne
+  dans un pool de processus ; dès qu'il se termine, il est ajouté à
+  `trials.jsonl`. Une recherche interrompue reprend avec les essais manquants.
+- Le meilleur essai (average precision moyenne) est réentraîné sur toutes les
+  données puis publié comme artefact versionné courant (model_store), que
+  app_corrige.py et streamlit_app.py chargent.
+
+    python training.py creditcard.csv --workers 4
+    python training.py creditcard.csv --grid '{"n_estimators": [100, 300], "max_depth": [12, null]}'
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import average_precision_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+from csv_cache import ensure_cache, fingerprint, load_columns, load_feature_matrix
+from forest_engine import compile_forest
+from model_store import CREDITCARD_MODEL, publish_artifact
+
+DEFAULT_WORK_DIR = 'training_runs'
+DEFAULT_GRID = {
+    'n_estimators': [100, 200],
+    'max_depth': [10, 20, None],
+    'min_samples_leaf': [1, 5],
+    'class_weight': [None, 'balanced_subsample'],
+}
+
+
+def load_training_data(csv_path):
+    """(X float32 memory-mappée, y, noms des features) depuis le cache de csv_cache"""
+    meta = ensure_cache(csv_path)
+    X = load_feature_matrix(csv_path)
+    label = meta['label_column']
+    y = np.asarray(load_columns(csv_path, [label])[label])
+    return X, y, meta['feature_columns']
+
+
+def expand_grid(grid):
+    """Liste des combinaisons d'hyperparamètres, dans un ordre stable"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def trial_key(params, n_splits, seed):
+    blob = json.dumps({'params': params, 'n_splits': n_splits, 'seed': seed}, sort_keys=True)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()[:12]
+
+
+def stratified_folds(y, n_splits, seed, path):
+    """Numéro de fold de chaque ligne ; calculé une fois puis relu depuis `path`"""
+    try:
+        with np.load(path) as saved:
+            if int(saved['n_splits']) == n_splits and int(saved['seed']) == seed \
+                    and len(saved['fold']) == len(y):
+                return saved['fold']
+    except (OSError, KeyError, ValueError):
+        pass
+    fold = np.empty(len(y), dtype=np.int8)
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    for k, (_, valid) in enumerate(splitter.split(np.zeros(len(y)), y)):
+        fold[valid] = k
+    tmp = f'{path}.tmp-{os.getpid()}.npz'
+    np.savez(tmp, fold=fold, n_splits=n_splits, seed=seed)
+    os.replace(tmp, path)
+    return fold
+
+
+def read_trials(path):
+    """Essais déjà terminés : {clé: enregistrement} (une dernière ligne tronquée est ignorée)"""
+    trials = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                trials[record['key']] = record
+    except OSError:
+        pass
+    return trials
+
+
+def append_trial(path, record):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def make_model(params, seed, n_jobs=1):
+    return RandomForestClassifier(random_state=seed, n_jobs=n_jobs, **params)
+
+
+_worker_data = None
+
+
+def _init_worker(csv_path, folds_path):
+    # Chaque worker memory-mappe les données et relit les folds
+    global _worker_data
+    X, y, _ = load_training_data(csv_path)
+    with np.load(folds_path) as saved:
+        _worker_data = (X, y, saved['fold'], int(saved['seed']))
+
+
+def run_trial(X, y, fold, params, seed):
+    """Évalue `params` sur chaque fold : average precision et ROC AUC, plus la durée"""
+    started = time.perf_counter()
+    scores = []
+    for k in range(int(fold.max()) + 1):
+        train, valid = fold != k, fold == k
+        model = make_model(params, seed).fit(X[train], y[train])
+        proba = model.predict_proba(X[valid])[:, list(model.classes_).index(1)]
+        scores.append({'average_precision': average_precision_score(y[valid], proba),
+                       'roc_auc': roc_auc_score(y[valid], proba)})
+    return {
+        'params': params,
+        'folds': scores,
+        'average_precision': float(np.mean([s['average_precision'] for s in scores])),
+        'roc_auc': float(np.mean([s['roc_auc'] for s in scores])),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def _run_trial_task(task):
+    key, params = task
+    X, y, fold, seed = _worker_data
+    return {'key': key, **run_trial(X, y, fold, params, seed)}
+
+
+def search(csv_path, work_dir=DEFAULT_WORK_DIR, grid=None, n_splits=5, seed=42, workers=None,
+           max_trials=None, restart=False, log=sys.stderr):
+    """Recherche sur la grille ; retourne (essais triés du meilleur au moins bon, durée totale).
+
+    Les résultats vont dans `<work_dir>/<empreinte du CSV>/` : une nouvelle
+    version des données repart de zéro, la même version reprend.
+    """
+    run_dir = os.path.join(work_dir, fingerprint(csv_path))
+    os.makedirs(run_dir, exist_ok=True)
+    trials_path = os.path.join(run_dir, 'trials.jsonl')
+    folds_path = os.path.join(run_dir, 'folds.npz')
+    if restart and os.path.exists(trials_path):
+        os.remove(trials_path)
+
+    _, y, _ = load_training_data(csv_path)
+    stratified_folds(y, n_splits, seed, folds_path)
+
+    candidates = expand_grid(grid or DEFAULT_GRID)[:max_trials]
+    done = read_trials(trials_path)
+    tasks = [(trial_key(p, n_splits, seed), p) for p in candidates]
+    todo = [t for t in tasks if t[0] not in done]
+    print(f"{len(tasks)} essais, {len(tasks) - len(todo)} déjà terminés, "
+          f"{len(todo)} à lancer ({n_splits} folds)", file=log)
+
+    started = time.perf_counter()
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        with multiprocessing.Pool(min(workers, len(todo)), initializer=_init_worker,
+                                  initargs=(csv_path, folds_path)) as pool:
+            for i, record in enumerate(pool.imap_unordered(_run_trial_task, todo), 1):
+                append_trial(trials_path, record)
+                done[record['key']] = record
+                print(f"[{i}/{len(todo)}] {json.dumps(record['params'])} "
+                      f"AP={record['average_precision']:.4f} AUC={record['roc_auc']:.4f} "
+                      f"({record['seconds']:.1f}s)", file=log)
+    elapsed = time.perf_counter() - started
+
+    wanted = {key for key, _ in tasks}
+    results = sorted((r for k, r in done.items() if k in wanted),
+                     key=lambda r: r['average_precision'], reverse=True)
+    return results, elapsed
+
+
+def export_best(csv_path, best, seed=42, n_splits=5, models_dir=None):
+    """Réentraîne le meilleur essai sur toutes les données et le publie (model_store)"""
+    X, y, feature_columns = load_training_data(csv_path)
+    started = time.perf_counter()
+    X = pd.DataFrame(np.asarray(X), columns=feature_columns, copy=False)  # garde feature_names_in_
+    model = make_model(best['params'], seed, n_jobs=-1).fit(X, y)
+    # Prédictions unitaires des applications : pas de pool de threads
+    model.set_params(n_jobs=None)
+    fit_seconds = time.perf_counter() - started
+    params = {
+        'data': fingerprint(csv_path),
+        'feature_columns': feature_columns,
+        'model': best['params'],
+        'seed': seed,
+    }
+    payload = {
+        'model': model,
+        'forest': compile_forest(model),
+        'feature_columns': feature_columns,
+        'cv': {'n_splits': n_splits, 'average_precision': best['average_precision'],
+               'roc_auc': best['roc_auc']},
+    }
+    return publish_artifact(CREDITCARD_MODEL, params, payload, models_dir), fit_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche d'hyperparamètres et entraînement")
+    parser.add_argument('csv', nargs='?', default='creditcard.csv')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR,
+                        help="Répertoire des folds et des essais (reprise)")
+    parser.add_argument('--grid', help="Grille JSON {paramètre: [valeurs]} (défaut : DEFAULT_GRID)")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help="Processus (défaut : nombre de CPU)")
+    parser.add_argument('--max-trials', type=int, default=None)
+    parser.add_argument('--restart', action='store_true', help="Ignore les essais déjà terminés")
+    parser.add_argument('--no-export', action='store_true', help="Ne publie pas le meilleur modèle")
+    args = parser.parse_args()
+
+    grid = json.loads(args.grid) if args.grid else None
+    results, elapsed = search(args.csv, args.work_dir, grid, n_splits=args.folds, seed=args.seed,
+                              workers=args.workers, max_trials=args.max_trials, restart=args.restart)
+    trial_seconds = sum(r['seconds'] for r in results)  # y compris les essais repris
+    print(f"\n{'AP':>8}{'AUC':>8}{'Durée':>9}  Paramètres")
+    for r in results:
+        print(f"{r['average_precision']:>8.4f}{r['roc_auc']:>8.4f}{r['seconds']:>8.1f}s  "
+              f"{json.dumps(r['params'])}")
+    print(f"Recherche : {elapsed:.1f}s de bout en bout, {trial_seconds:.1f}s cumulés par essai")
+
+    if results and not args.no_export:
+        path, fit_seconds = export_best(args.csv, results[0], seed=args.seed, n_splits=args.folds)
+        print(f"Meilleur modèle réentraîné en {fit_seconds:.1f}s et publié : {path}")
+
+
+if __name__ == '__main__':
+    main()
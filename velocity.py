@@ -0,0 +1,313 @@
+"""Features de vélocité par carte : nombre de transactions et montant sur des fenêtres glissantes.
+
+Pour chaque carte (ou compte), le magasin en mémoire garde les transactions
+récentes dans un buffer circulaire (temps en float64, montants en centimes
+int64) et, pour chaque fenêtre, la position de la plus ancienne transaction
+encore dedans et la somme courante. Une transaction ou une lecture avance ces
+positions (éviction par le temps) : O(1) amorti par événement, quel que soit
+l'historique. La fenêtre de durée w à l'instant t est l'intervalle ]t - w, t].
+
+`backfill` calcule les mêmes features pour tout un historique en quelques
+opérations vectorisées (tri par carte puis par temps, sommes préfixes) :
+les données d'entraînement et le service utilisent exactement la même
+définition. Les montants en centimes entiers rendent les deux chemins
+identiques au bit près.
+
+    python velocity.py backfill transactions.csv features.csv --card-column card_id --time-column Time
+    python velocity.py check transactions.csv --card-column card_id --time-column Time
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+# Fenêtres par défaut, en secondes : 1 minute, 10 minutes, 1 heure, 1 jour
+DEFAULT_WINDOWS = (60, 600, 3600, 86400)
+INITIAL_CAPACITY = 8
+
+
+def window_label(seconds):
+    if seconds % 3600 == 0:
+        return f'{seconds // 3600}h'
+    if seconds % 60 == 0:
+        return f'{seconds // 60}m'
+    return f'{seconds}s'
+
+
+def feature_names(windows=DEFAULT_WINDOWS):
+    names = []
+    for w in windows:
+        names += [f'count_{window_label(w)}', f'amount_{window_label(w)}']
+    return names + ['seconds_since_last']
+
+
+def to_cents(amounts):
+    return np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+
+
+class _Card:
+    """Transactions récentes d'une carte. Les positions sont des numéros d'événement absolus ;
+    l'événement n est rangé à l'indice n % capacité."""
+
+    __slots__ = ('times', 'cents', 'count', 'starts', 'sums', 'last', 'clock')
+
+    def __init__(self, n_windows, capacity=INITIAL_CAPACITY):
+        self.times = array('d', bytes(8 * capacity))
+        self.cents = array('q', bytes(8 * capacity))
+        self.count = 0
+        self.starts = [0] * n_windows
+        self.sums = [0] * n_windows
+        self.last = None
+        self.clock = float('-inf')
+
+    def evict(self, windows, t):
+        times, cents, n = self.times, self.cents, self.count
+        capacity = len(times)
+        for k, w in enumerate(windows):
+            s = self.starts[k]
+            limit = t - w
+            while s < n and times[s % capacity] <= limit:
+                self.sums[k] -= cents[s % capacity]
+                s += 1
+            self.starts[k] = s
+
+    def append(self, t, cents):
+        capacity = len(self.times)
+        # La plus grande fenêtre (la dernière) retient le plus d'événements
+        oldest = self.starts[-1]
+        if self.count - oldest == capacity:
+            self._grow(oldest, 2 * capacity)
+            capacity = len(self.times)
+        i = self.count % capacity
+        self.times[i] = t
+        self.cents[i] = cents
+        self.count += 1
+        for k in range(len(self.sums)):
+            self.sums[k] += cents
+        self.last = t
+
+    def _grow(self, oldest, capacity):
+        old_capacity = len(self.times)
+        times = array('d', bytes(8 * capacity))
+        cents = array('q', bytes(8 * capacity))
+        for seq in range(oldest, self.count):
+            times[seq % capacity] = self.times[seq % old_capacity]
+            cents[seq % capacity] = self.cents[seq % old_capacity]
+        self.times, self.cents = times, cents
+
+    def retained(self):
+        """(temps, centimes) des transactions encore dans la plus grande fenêtre"""
+        capacity = len(self.times)
+        seqs = range(self.starts[-1], self.count)
+        return [self.times[s % capacity] for s in seqs], [self.cents[s % capacity] for s in seqs]
+
+
+class VelocityStore:
+    """Features de vélocité par carte, mises à jour événement par événement"""
+
+    def __init__(self, windows=DEFAULT_WINDOWS):
+        self.windows = tuple(sorted(int(w) for w in windows))
+        self.feature_names = feature_names(self.windows)
+        self._cards = {}
+        self._lock = threading.Lock()
+        self.events = 0
+
+    def __len__(self):
+        return len(self._cards)
+
+    def _features(self, card, t, previous):
+        values = []
+        for k in range(len(self.windows)):
+            values += [card.count - card.starts[k], card.sums[k] / 100]
+        values.append(t - previous if previous is not None else float('nan'))
+        return values
+
+    def update(self, card_id, timestamp, amount):
+        """Ajoute une transaction et retourne ses features (transaction comprise).
+
+        Les transactions d'une carte doivent arriver dans l'ordre du temps ; une
+        transaction en retard est datée de la dernière vue pour cette carte.
+        """
+        cents = int(round(float(amount) * 100))
+        with self._lock:
+            card = self._cards.get(card_id)
+            if card is None:
+                card = self._cards[card_id] = _Card(len(self.windows))
+            t = max(float(timestamp), card.clock)
+            card.clock = t
+            previous = card.last
+            card.evict(self.windows, t)
+            card.append(t, cents)
+            self.events += 1
+            return self._features(card, t, previous)
+
+    def lookup(self, card_id, timestamp):
+        """Features à l'instant `timestamp` sans ajouter de transaction"""
+        with self._lock:
+            card = self._cards.get(card_id)
+            if card is None:
+                return [0, 0.0] * len(self.windows) + [float('nan')]
+            t = max(float(timestamp), card.clock)
+            card.clock = t
+            card.evict(self.windows, t)
+            return self._features(card, t, card.last)
+
+    def update_many(self, card_ids, timestamps, amounts):
+        """Features (DataFrame) d'une suite de transactions, traitées dans l'ordre"""
+        rows = [self.update(c, t, a) for c, t, a in zip(card_ids, timestamps, amounts)]
+        return pd.DataFrame(rows, columns=self.feature_names)
+
+    def save(self, path):
+        """Instantané sur disque (fichier .npz écrit de façon atomique)"""
+        with self._lock:
+            keys, counts, times, cents, last, clock = [], [], [], [], [], []
+            for key, card in self._cards.items():
+                card_times, card_cents = card.retained()
+                keys.append(key)
+                counts.append(len(card_times))
+                times += card_times
+                cents += card_cents
+                last.append(np.nan if card.last is None else card.last)
+                clock.append(card.clock)
+            meta = {'format_version': FORMAT_VERSION, 'windows': list(self.windows),
+                    'keys': keys, 'events': self.events}
+        tmp = f'{path}.tmp-{os.getpid()}.npz'
+        # Clés NumPy (np.int64...) converties en scalaires Python
+        np.savez(tmp, meta=json.dumps(meta, default=lambda o: o.item()),
+                 counts=np.asarray(counts, dtype=np.int64), times=np.asarray(times, dtype=np.float64), cents=np.asarray(cents, dtype=np.int64),
+                 last=np.asarray(last, dtype=np.float64), clock=np.asarray(clock, dtype=np.float64))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            meta = json.loads(str(saved['meta']))
+            if meta.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"Format d'instantané non supporté : {meta.get('format_version')}")
+            store = cls(meta['windows'])
+            store.events = meta['events']
+            offsets = np.concatenate([[0], np.cumsum(saved['counts'])])
+            times, cents = saved['times'].tolist(), saved['cents'].tolist()
+            for i, key in enumerate(meta['keys']):
+                # Les clés JSON sont des str/int : une liste (clé composite) redevient un tuple
+                key = tuple(key) if isinstance(key, list) else key
+                card = _Card(len(store.windows))
+                for t, c in zip(times[offsets[i]:offsets[i + 1]], cents[offsets[i]:offsets[i + 1]]):
+                    card.append(t, c)
+                last = float(saved['last'][i])
+                card.last = None if np.isnan(last) else last
+                card.clock = float(saved['clock'][i])
+                card.evict(store.windows, card.clock)
+                store._cards[key] = card
+        return store
+
+    @classmethod
+    def from_env(cls):
+        """Instantané FRAUDE_VELOCITY_SNAPSHOT s'il existe, sinon un magasin vide"""
+        path = os.environ.get('FRAUDE_VELOCITY_SNAPSHOT')
+        if path and os.path.exists(path):
+            return cls.load(path)
+        return cls()
+
+
+def backfill(card_ids, timestamps, amounts, windows=DEFAULT_WINDOWS):
+    """Features de chaque transaction de l'historique, comme si elles arrivaient une à une.
+
+    Équivalent à VelocityStore.update_many sur les mêmes transactions prises
+    dans l'ordre (carte, temps, ordre d'origine). Le résultat suit l'ordre d'origine.
+    """
+    windows = tuple(sorted(int(w) for w in windows))
+    codes, _ = pd.factorize(pd.Series(card_ids), sort=False)
+    t = np.asarray(timestamps, dtype=np.float64)
+    cents = to_cents(amounts)
+    n = len(t)
+    order = np.lexsort((np.arange(n), t, codes))
+    codes, t, cents = codes[order], t[order], cents[order]
+
+    position = np.arange(n)
+    new_card = np.ones(n, dtype=bool)
+    new_card[1:] = codes[1:] != codes[:-1]
+    prefix = np.concatenate([[0], np.cumsum(cents)])
+
+    columns = {}
+    kind = np.concatenate([np.zeros(n, dtype=np.int8), np.ones(n, dtype=np.int8)])
+    merged_codes = np.concatenate([codes, codes])
+    for w in windows:
+        # Transactions évincées : même carte et temps <= t - w. Un tri commun des
+        # transactions et des bornes (transactions d'abord à égalité) donne, pour
+        # chaque borne, l'indice de la première transaction encore dans la fenêtre.
+        values = np.concatenate([t, t - w])
+        merged = np.lexsort((kind, values, merged_codes))
+        is_bound = kind[merged] == 1
+        events_before = np.cumsum(~is_bound) - (~is_bound)
+        left = np.empty(n, dtype=np.int64)
+        left[merged[is_bound] - n] = events_before[is_bound]
+        label = window_label(w)
+        columns[f'count_{label}'] = position - left + 1
+        columns[f'amount_{label}'] = (prefix[position + 1] - prefix[left]) / 100
+
+    since_last = np.full(n, np.nan)
+    since_last[~new_card] = np.diff(t)[~new_card[1:]]
+    columns['seconds_since_last'] = since_last
+
+    # Retour à l'ordre d'origine des transactions
+    return pd.DataFrame(columns).iloc[np.argsort(order)].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Features de vélocité par carte")
+    parser.add_argument('command', choices=['backfill', 'check'])
+    parser.add_argument('input', help="CSV de transactions")
+    parser.add_argument('output', nargs='?', help="CSV des features (backfill)")
+    parser.add_argument('--card-column', default='card_id')
+    parser.add_argument('--time-column', default='Time')
+    parser.add_argument('--amount-column', default='Amount')
+    parser.add_argument('--windows', default=','.join(map(str, DEFAULT_WINDOWS)),
+                        help="Fenêtres en secondes, ex. 60,600,3600")
+    parser.add_argument('--snapshot', help="Enregistre aussi l'état du magasin (.npz) en fin d'historique")
+    args = parser.parse_args()
+    windows = [int(w) for w in args.windows.split(',')]
+
+    df = pd.read_csv(args.input, usecols=[args.card_column, args.time_column, args.amount_column])
+    cards, times, amounts = df[args.card_column], df[args.time_column], df[args.amount_column]
+
+    started = time.perf_counter()
+    features = backfill(cards, times, amounts, windows)
+    backfill_seconds = time.perf_counter() - started
+    print(f"Backfill : {len(df):,} transactions, {cards.nunique():,} cartes en "
+          f"{backfill_seconds:.2f}s ({len(df) / backfill_seconds:,.0f}/s)")
+
+    if args.command == 'check' or args.snapshot:
+        # Rejoue l'historique dans l'ordre du temps, comme en production
+        order = np.lexsort((np.arange(len(df)), times.to_numpy(), pd.factorize(cards)[0]))
+        store = VelocityStore(windows)
+        started = time.perf_counter()
+        live = store.update_many(cards.to_numpy()[order], times.to_numpy()[order], amounts.to_numpy()[order])
+        live_seconds = time.perf_counter() - started
+        print(f"Magasin en ligne : {len(df) / live_seconds:,.0f} transactions/s "
+              f"({live_seconds / len(df) * 1e6:.1f} µs par mise à jour)")
+        if args.command == 'check':
+            expected = features.iloc[order].reset_index(drop=True)
+            if not expected.equals(live.astype(expected.dtypes.to_dict())):
+                raise SystemExit("Différence entre le backfill et le magasin en ligne")
+            print("Backfill et magasin en ligne identiques")
+        if args.snapshot:
+            store.save(args.snapshot)
+            print(f"Instantané : {args.snapshot} ({len(store):,} cartes)")
+
+    if args.command == 'backfill':
+        if not args.output:
+            raise SystemExit("backfill : fichier de sortie manquant")
+        features.to_csv(args.output, index=False)
+        print(f"Features écrites dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()